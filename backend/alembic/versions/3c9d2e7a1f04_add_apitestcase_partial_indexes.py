@@ -0,0 +1,50 @@
+"""Add partial indexes for active API test cases
+
+Revision ID: 3c9d2e7a1f04
+Revises: 6f165be7569b
+Create Date: 2026-10-15 10:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9d2e7a1f04'
+down_revision: Union[str, Sequence[str], None] = '6f165be7569b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ACTIVE = sa.text("is_deleted = false")
+ACTIVE_ENABLED = sa.text("is_deleted = false AND enabled = true")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 用例列表只查询未删除的用例：部分索引跳过已软删除的行
+    op.create_index(
+        'ix_apitestcase_project_active',
+        'apitestcase',
+        ['project_id', sa.text('created_at DESC')],
+        unique=False,
+        postgresql_where=ACTIVE,
+        sqlite_where=ACTIVE,
+    )
+    # enabled_only=true 时使用
+    op.create_index(
+        'ix_apitestcase_project_active_enabled',
+        'apitestcase',
+        ['project_id', sa.text('created_at DESC')],
+        unique=False,
+        postgresql_where=ACTIVE_ENABLED,
+        sqlite_where=ACTIVE_ENABLED,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_apitestcase_project_active_enabled', table_name='apitestcase')
+    op.drop_index('ix_apitestcase_project_active', table_name='apitestcase')
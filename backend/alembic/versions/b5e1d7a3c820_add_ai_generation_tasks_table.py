@@ -0,0 +1,45 @@
+"""Add AI generation tasks table
+
+Revision ID: b5e1d7a3c820
+Revises: f2c6a8d4b913
+Create Date: 2026-10-15 23:58:12.406731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e1d7a3c820'
+down_revision: Union[str, Sequence[str], None] = 'f2c6a8d4b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 创建AI用例生成任务表
+    op.create_table('ai_generation_tasks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('requirement_id', sa.Integer(), nullable=False),
+    sa.Column('model', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error_message', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ai_generation_tasks', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ai_generation_tasks_requirement_id'), ['requirement_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('ai_generation_tasks', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ai_generation_tasks_requirement_id'))
+
+    op.drop_table('ai_generation_tasks')
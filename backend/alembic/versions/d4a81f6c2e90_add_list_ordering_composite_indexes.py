@@ -0,0 +1,50 @@
+"""Add composite indexes for functional list endpoints
+
+Revision ID: d4a81f6c2e90
+Revises: 3c9d2e7a1f04
+Create Date: 2026-10-15 14:03:17.220561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a81f6c2e90'
+down_revision: Union[str, Sequence[str], None] = '3c9d2e7a1f04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 用例列表：按需求、优先级过滤并按创建时间倒序分页
+    op.create_index(
+        'ix_test_cases_requirement_priority_created',
+        'test_cases',
+        ['requirement_id', 'priority', sa.text('created_at DESC')],
+        unique=False,
+    )
+    # 需求列表：按创建时间倒序分页
+    op.create_index(
+        'ix_requirements_created_at',
+        'requirements',
+        [sa.text('created_at DESC')],
+        unique=False,
+    )
+    # 项目列表：按更新时间倒序分页
+    op.create_index(
+        'ix_project_updated_at',
+        'project',
+        [sa.text('updated_at DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_project_updated_at', table_name='project')
+    op.drop_index('ix_requirements_created_at', table_name='requirements')
+    op.drop_index('ix_test_cases_requirement_priority_created', table_name='test_cases')
@@ -0,0 +1,34 @@
+"""Add keyset pagination index for test cases by requirement
+
+Revision ID: e7b3f19a5c21
+Revises: d4a81f6c2e90
+Create Date: 2026-10-15 23:12:08.417305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3f19a5c21'
+down_revision: Union[str, Sequence[str], None] = 'd4a81f6c2e90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 需求下的用例按 (优先级, id) 游标分页
+    op.create_index(
+        'ix_test_cases_requirement_priority_id',
+        'test_cases',
+        ['requirement_id', 'priority', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_test_cases_requirement_priority_id', table_name='test_cases')
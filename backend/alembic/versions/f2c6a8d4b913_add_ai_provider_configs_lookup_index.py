@@ -0,0 +1,34 @@
+"""Add composite lookup index for AI provider configs
+
+Revision ID: f2c6a8d4b913
+Revises: e7b3f19a5c21
+Create Date: 2026-10-15 23:31:45.902118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6a8d4b913'
+down_revision: Union[str, Sequence[str], None] = 'e7b3f19a5c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 按用户查询启用/默认配置（可再按厂商类型过滤）
+    op.create_index(
+        'ix_ai_provider_configs_user_enabled_default',
+        'ai_provider_configs',
+        ['user_id', 'is_enabled', sa.text('is_default DESC'), 'provider_type'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ai_provider_configs_user_enabled_default', table_name='ai_provider_configs')
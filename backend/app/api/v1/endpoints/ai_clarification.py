@@ -2,56 +2,271 @@
 AI需求澄清API - 功能测试模块
 提供多轮对话的需求澄清接口
 """
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-import json
+import orjson
 
-from app.core.db import get_session
+from app.core.db import get_session, async_session_maker
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.services.ai.graphs.requirement_clarification_graph import RequirementClarificationGraph
 
+try:
+    # sse-starlette 自带心跳与 SSE 响应头，未安装时回退到 StreamingResponse
+    from sse_starlette.sse import EventSourceResponse
+except ImportError:  # pragma: no cover
+    EventSourceResponse = None
+
 router = APIRouter(tags=["AI需求澄清"])
 
+# 每个进程最多缓存的需求澄清图实例数
+GRAPH_CACHE_SIZE = 1024
+
+# SSE 心跳间隔（秒），避免空闲的 LLM 生成被 Nginx/CDN 超时断开
+SSE_PING_INTERVAL = 15
+
+# SSE chunk 合并窗口（秒）与单帧最多合并的chunk数
+SSE_BATCH_WINDOW = 0.015
+SSE_BATCH_MAX_ITEMS = 32
+
+# SSE 帧的固定片段，预先编码避免每个事件重复分配与编码
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+DONE_FRAME = b"data: [DONE]\n\n"
+
+
+def _sse_frame(payload: bytes) -> bytes:
+    """将已编码的 JSON 负载组装为一条 SSE 帧"""
+    return b"".join((_SSE_PREFIX, payload, _SSE_SUFFIX))
+
 
 class StreamingResponseGenerator:
     """流式响应生成器"""
 
-    def __init__(self, graph, requirement_id: str, user_input: str):
+    def __init__(
+        self,
+        graph,
+        requirement_id: str,
+        user_input: str,
+        session: AsyncSession,
+        stream_tokens: bool = False
+    ):
         self.graph = graph
         self.requirement_id = requirement_id
         self.user_input = user_input
+        self.session = session
+        self.stream_tokens = stream_tokens
+
+    async def generate(self) -> AsyncIterator[bytes]:
+        """
+        生成流式响应
+
+        在 SSE_BATCH_WINDOW 时间窗口内连续到达的chunk会合并为一个
+        {"type": "batch", "items": [...]} 帧，减少序列化与写操作次数；
+        窗口内只有一个chunk时按原格式发送。
+        """
+        chunks = self.graph.astream_chat(
+            self.requirement_id, self.user_input,
+            session=self.session, stream_tokens=self.stream_tokens
+        ).__aiter__()
+        pending: Optional[asyncio.Future] = None
+        buffer: List[Dict[str, Any]] = []
 
-    async def generate(self):
-        """生成流式响应"""
         try:
-            async for chunk in self.graph.astream_chat(
-                self.requirement_id,
-                self.user_input
-            ):
-                # 将chunk转换为SSE格式
-                data = json.dumps(chunk, ensure_ascii=False)
-                yield f"data: {data}\n\n"
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(chunks.__anext__())
+
+                # 缓冲区为空时一直等待；否则最多等待一个合并窗口
+                # （使用 asyncio.wait 而非 wait_for，超时不会取消正在进行的 __anext__）
+                done, _ = await asyncio.wait(
+                    {pending},
+                    timeout=SSE_BATCH_WINDOW if buffer else None
+                )
+                if not done:
+                    yield self._flush(buffer)
+                    continue
+
+                future, pending = pending, None
+                try:
+                    chunk = future.result()
+                except StopAsyncIteration:
+                    break
+
+                buffer.append(chunk)
+                if len(buffer) >= SSE_BATCH_MAX_ITEMS:
+                    yield self._flush(buffer)
+
+            if buffer:
+                yield self._flush(buffer)
 
             # 发送结束标记
-            yield "data: [DONE]\n\n"
+            yield DONE_FRAME
 
         except Exception as e:
-            # 发送错误信息
-            error_data = json.dumps({
-                "type": "error",
-                "content": str(e)
-            }, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            if buffer:
+                yield self._flush(buffer)
+            # 发送错误信息，仅错误内容需要序列化
+            yield _sse_frame(b'{"type":"error","content":' + orjson.dumps(str(e)) + b"}")
+
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    @staticmethod
+    def _flush(buffer: List[Dict[str, Any]]) -> bytes:
+        """将缓冲区中的chunk编码为一条SSE帧并清空缓冲区"""
+        if len(buffer) == 1:
+            payload = orjson.dumps(buffer[0])
+        else:
+            payload = orjson.dumps({"type": "batch", "items": buffer})
+        buffer.clear()
+        return _sse_frame(payload)
+
+
+# 共享流的键：(用户ID, 需求ID, 用户输入, 是否推送token)，只有完全相同的请求才会共享同一次图执行
+StreamKey = Tuple[int, str, str, bool]
+
+
+async def _produce_frames(
+    graph,
+    requirement_id: str,
+    user_input: str,
+    stream_tokens: bool
+) -> AsyncIterator[bytes]:
+    """
+    生产者任务的帧生成器
+
+    生产者任务可能比发起它的请求活得更久，因此使用独立的数据库会话，
+    而不是在请求结束时就会关闭的请求级会话。
+    """
+    async with async_session_maker() as session:
+        frames = StreamingResponseGenerator(
+            graph, requirement_id, user_input, session, stream_tokens
+        ).generate()
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+
+
+class _SharedStream:
+    """一次共享的图执行：生产者任务、订阅队列与已发送的帧"""
+
+    __slots__ = ("task", "subscribers", "frames")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[asyncio.Queue] = []
+        # 已发送的帧，供中途加入的订阅者回放，保证拼接出的消息完整
+        self.frames: List[bytes] = []
+
+
+class SSEBroadcaster:
+    """
+    SSE 广播器
+
+    同一用户对同一需求的相同输入重复发起请求时，多个订阅者共享一次图执行：
+    每个 chunk 只在生产者任务中序列化一次，编码好的 SSE 帧再分发给所有订阅者。
+    """
+
+    def __init__(self):
+        self._streams: Dict[StreamKey, _SharedStream] = {}
+
+    def is_active(self, key: StreamKey) -> bool:
+        """是否已有该 key 的流正在生成"""
+        return key in self._streams
+
+    def subscribe(self, key: StreamKey) -> asyncio.Queue:
+        """订阅正在生成的流，先回放已发送的帧"""
+        stream = self._streams[key]
+        queue: asyncio.Queue = asyncio.Queue()
+        for frame in stream.frames:
+            queue.put_nowait(frame)
+        stream.subscribers.append(queue)
+        return queue
+
+    def start(self, key: StreamKey, frames: AsyncIterator[bytes]) -> asyncio.Queue:
+        """启动生产者任务，并返回首个订阅者的队列"""
+        stream = _SharedStream()
+        self._streams[key] = stream
+        queue = self.subscribe(key)
+        stream.task = asyncio.create_task(self._pump(key, stream, frames))
+        return queue
+
+    async def stream(self, key: StreamKey, queue: asyncio.Queue) -> AsyncIterator[bytes]:
+        """将订阅队列中的帧逐个转发给客户端"""
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self._unsubscribe(key, queue)
+
+    def _unsubscribe(self, key: StreamKey, queue: asyncio.Queue) -> None:
+        stream = self._streams.get(key)
+        if stream is None or queue not in stream.subscribers:
+            return
+        stream.subscribers.remove(queue)
+        # 所有订阅者都已断开时停止生成；先移出注册表，
+        # 避免新请求在任务真正结束前订阅到即将取消的流而得到空响应
+        if not stream.subscribers:
+            del self._streams[key]
+            if stream.task is not None and not stream.task.done():
+                stream.task.cancel()
+
+    async def _pump(self, key: StreamKey, stream: _SharedStream, frames: AsyncIterator[bytes]) -> None:
+        try:
+            async for frame in frames:
+                stream.frames.append(frame)
+                for queue in stream.subscribers:
+                    queue.put_nowait(frame)
+        finally:
+            await frames.aclose()
+            # 同一 key 可能已由新的流接替，只移除自己
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+            for queue in stream.subscribers:
+                queue.put_nowait(None)
+
+
+# 进程级广播器，按 (用户, 需求, 输入) 共享流
+sse_broadcaster = SSEBroadcaster()
+
+# 按用户缓存的需求澄清图实例（LRU）
+_graph_cache: "OrderedDict[int, RequirementClarificationGraph]" = OrderedDict()
+
+
+def _get_graph(user_id: int) -> RequirementClarificationGraph:
+    """
+    获取用户的需求澄清图实例
+
+    缓存的图实例不绑定会话，数据库会话在每次调用 astream_chat 时传入。
+    """
+    graph = _graph_cache.get(user_id)
+    if graph is None:
+        graph = RequirementClarificationGraph(None, user_id)
+        _graph_cache[user_id] = graph
+        if len(_graph_cache) > GRAPH_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+    else:
+        _graph_cache.move_to_end(user_id)
+
+    return graph
 
 
 @router.post("/clarify")
 async def clarify_requirement(
     requirement_id: str,
     user_input: str,
-    session: AsyncSession = Depends(get_session),
+    stream_tokens: bool = Query(False, description="是否推送LLM生成中的原始文本片段（token事件）"),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -61,6 +276,7 @@ async def clarify_requirement(
 
     - **requirement_id**: 需求ID，用作会话标识
     - **user_input**: 用户的输入或回复
+    - **stream_tokens**: 是否额外推送 {"type": "token"} 事件（LLM生成中的原始JSON片段，默认关闭）
 
     返回SSE流，每条消息格式为：
     ```json
@@ -70,22 +286,38 @@ async def clarify_requirement(
       "is_complete": false
     }
     ```
+
+    同一用户对同一需求ID以相同输入重复请求、且已有对话在生成时，新的请求会直接订阅该输出流（先回放已生成的部分）。
     """
-    # 创建需求澄清图实例
+    key: StreamKey = (current_user.id, requirement_id, user_input, stream_tokens)
+
+    # 已有进行中的相同流：直接订阅，共享同一份序列化结果
+    if sse_broadcaster.is_active(key):
+        queue = sse_broadcaster.subscribe(key)
+        return _sse_response(sse_broadcaster.stream(key, queue))
+
+    # 获取需求澄清图实例（按用户缓存）
     try:
-        graph = RequirementClarificationGraph(session, current_user.id)
+        graph = _get_graph(current_user.id)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"初始化需求澄清图失败: {str(e)}"
         )
 
-    # 创建流式响应生成器
-    generator = StreamingResponseGenerator(graph, requirement_id, user_input)
+    # 创建流式响应生成器（使用独立会话），并由广播器负责分发
+    queue = sse_broadcaster.start(key, _produce_frames(graph, requirement_id, user_input, stream_tokens))
+
+    return _sse_response(sse_broadcaster.stream(key, queue))
+
+
+def _sse_response(frames: AsyncIterator[bytes]):
+    """构造SSE响应（已编码的字节帧会被 EventSourceResponse 原样透传）"""
+    if EventSourceResponse is not None:
+        return EventSourceResponse(frames, ping=SSE_PING_INTERVAL)
 
-    # 返回SSE流
     return StreamingResponse(
-        generator.generate(),
+        frames,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
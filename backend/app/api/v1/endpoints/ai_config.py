@@ -2,9 +2,12 @@
 AI配置管理API - 功能测试模块
 提供AI厂商配置的增删改查接口
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Tuple
+import hashlib
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
+import orjson
+from pydantic import TypeAdapter
 
 from app.core.db import get_session
 from app.api.deps import get_current_user
@@ -21,22 +24,63 @@ from app.services.ai_config_service import AIConfigService
 
 router = APIRouter(tags=["AI配置管理"])
 
+# 一次性序列化配置列表
+_CONFIGS_ADAPTER = TypeAdapter(List[AIProviderConfigResponse])
+
+# 批量测试API连接时单次请求的最大配置数
+API_TEST_BATCH_MAX = 20
+
+
+def _pre_encode(data) -> Tuple[bytes, str]:
+    """预先序列化JSON并计算强ETag"""
+    body = orjson.dumps(data)
+    return body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+# 预设配置是静态数据：导入时预先序列化并计算ETag，请求时直接返回字节
+_PRESETS_JSON, _PRESETS_ETAG = _pre_encode({
+    "presets": PRESET_CONFIGS,
+    "supported_types": list(PRESET_CONFIGS.keys())
+})
+_PRESET_JSON = {
+    provider_type: _pre_encode(preset)
+    for provider_type, preset in PRESET_CONFIGS.items()
+}
+_PRESET_CACHE_CONTROL = "public, max-age=3600"
+
+
+def _cached_json_response(request: Request, body: bytes, etag: str) -> Response:
+    """返回预序列化的JSON，客户端缓存命中时返回304"""
+    headers = {"ETag": etag, "Cache-Control": _PRESET_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.get("/", response_model=List[AIProviderConfigResponse])
 async def list_ai_configs(
+    include_masked: bool = Query(True, description="是否解密并返回脱敏的API Key"),
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     """
     获取当前用户的所有AI配置
 
-    返回用户的AI配置列表，API Key已脱敏
+    返回用户的AI配置列表，API Key已脱敏；
+    只需要配置元数据时传 include_masked=false，跳过API Key解密
     """
-    configs = await AIConfigService.get_user_configs(session, current_user.id)
-    return configs
+    configs = await AIConfigService.get_user_configs(
+        session, current_user.id, include_masked=include_masked
+    )
+    # 直接返回序列化后的字节，跳过 response_model 的重新校验与 jsonable_encoder；
+    # 与单条配置接口一致，省略值为 null 的字段（如未设置的 api_endpoint）
+    return Response(
+        _CONFIGS_ADAPTER.dump_json(configs, exclude_none=True),
+        media_type="application/json"
+    )
 
 
-@router.get("/default", response_model=AIProviderConfigResponse)
+@router.get("/default", response_model=AIProviderConfigResponse, response_model_exclude_none=True)
 async def get_default_config(
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
@@ -57,7 +101,7 @@ async def get_default_config(
     return config
 
 
-@router.get("/{config_id}", response_model=AIProviderConfigResponse)
+@router.get("/{config_id}", response_model=AIProviderConfigResponse, response_model_exclude_none=True)
 async def get_ai_config(
     config_id: int,
     session: AsyncSession = Depends(get_session),
@@ -79,7 +123,12 @@ async def get_ai_config(
     return config
 
 
-@router.post("/", response_model=AIProviderConfigResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=AIProviderConfigResponse,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_201_CREATED
+)
 async def create_ai_config(
     data: AIProviderConfigCreate,
     session: AsyncSession = Depends(get_session),
@@ -106,7 +155,7 @@ async def create_ai_config(
         )
 
 
-@router.put("/{config_id}", response_model=AIProviderConfigResponse)
+@router.put("/{config_id}", response_model=AIProviderConfigResponse, response_model_exclude_none=True)
 async def update_ai_config(
     config_id: int,
     data: AIProviderConfigUpdate,
@@ -152,32 +201,30 @@ async def delete_ai_config(
 
 
 @router.get("/presets/{provider_type}", response_model=dict)
-async def get_preset_config(provider_type: str):
+async def get_preset_config(provider_type: str, request: Request):
     """
     获取预设的AI厂商配置模板
 
     返回指定厂商类型的推荐配置
     """
-    if provider_type not in PRESET_CONFIGS:
+    cached = _PRESET_JSON.get(provider_type)
+    if cached is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"不支持的厂商类型: {provider_type}。支持的类型: {list(PRESET_CONFIGS.keys())}"
         )
 
-    return PRESET_CONFIGS[provider_type]
+    return _cached_json_response(request, *cached)
 
 
 @router.get("/presets", response_model=dict)
-async def list_preset_configs():
+async def list_preset_configs(request: Request):
     """
     获取所有预设的AI厂商配置模板
 
     返回所有支持的厂商类型及其推荐配置
     """
-    return {
-        "presets": PRESET_CONFIGS,
-        "supported_types": list(PRESET_CONFIGS.keys())
-    }
+    return _cached_json_response(request, _PRESETS_JSON, _PRESETS_ETAG)
 
 
 @router.post("/test", response_model=TestResult)
@@ -207,3 +254,19 @@ async def test_api_config(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"测试API连接失败: {str(e)}"
         )
+
+
+@router.post("/test/batch", response_model=List[TestResult])
+async def test_api_configs(
+    data: List[AIProviderConfigTest] = Body(..., max_length=API_TEST_BATCH_MAX)
+):
+    """
+    并发测试多个AI配置的API连接
+
+    请求体为 /test 接口参数的列表（最多20个），
+    返回与请求顺序一致的测试结果列表
+    """
+    return await AIConfigService.test_many([
+        (item.provider_type.value, item.api_key, item.model_name, item.api_endpoint)
+        for item in data
+    ])
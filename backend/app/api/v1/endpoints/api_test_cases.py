@@ -2,12 +2,19 @@
 API 测试用例相关的 API 端点
 """
 
-from typing import List, Optional
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from typing import AsyncIterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from app.core.db import get_session
+from sqlalchemy import select, func, lambda_stmt
+from sqlalchemy.sql import StatementLambdaElement
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import flag_modified
+import orjson
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.db import get_session, async_session_maker
 from app.api import deps
 from app.models.api_test_case import ApiTestCase, ApiTestExecution, ApiTestStepResult
 from app.models.project import Project
@@ -32,6 +39,18 @@ from app.services.test_result_processor import TestResultProcessor
 
 router = APIRouter()
 
+# 列表总数缓存（按过滤条件），写操作时清空
+_count_cache = TTLCache(ttl=30)
+
+# 步骤结果流式读取时每批从游标获取的行数
+STEP_RESULT_BATCH_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# 无状态服务单例，避免每个请求重复构造
+_yaml_generator = YAMLGenerator()
+_engine_adapter = APIEngineAdapter(stdin_cases=settings.API_ENGINE_STDIN_CASES)
+_result_processor = TestResultProcessor()
+
 
 # ============================================================================
 # 辅助函数
@@ -66,6 +85,85 @@ async def verify_project_access(
     return project
 
 
+async def get_execution_with_project(
+    execution_id: int,
+    current_user: User,
+    session: AsyncSession
+) -> Tuple[ApiTestExecution, Optional[Project]]:
+    """
+    获取执行记录并验证项目访问权限（辅助函数）
+
+    通过一次 JOIN 查询同时取出执行记录、所属用例的项目，
+    避免 执行记录 -> 测试用例 -> 项目 三次往返。
+    """
+    result = await session.execute(lambda_stmt(
+        lambda: select(ApiTestExecution, ApiTestCase.project_id, Project)
+        .outerjoin(ApiTestCase, ApiTestCase.id == ApiTestExecution.test_case_id)
+        .outerjoin(Project, Project.id == ApiTestCase.project_id)
+        .where(ApiTestExecution.id == execution_id)
+    ))
+    row = result.first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"执行记录不存在: {execution_id}"
+        )
+
+    execution, project_id, project = row
+    if project_id is not None and project is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"项目不存在: {project_id}"
+        )
+    return execution, project
+
+
+# 列表接口返回的摘要字段
+_SUMMARY_COLUMNS = (
+    ApiTestCase.id,
+    ApiTestCase.project_id,
+    ApiTestCase.name,
+    ApiTestCase.description,
+    ApiTestCase.environment_id,
+    ApiTestCase.tags,
+    ApiTestCase.enabled,
+    ApiTestCase.created_at,
+    ApiTestCase.updated_at,
+)
+
+
+def _apply_list_filters(
+    stmt: StatementLambdaElement,
+    search: Optional[str],
+    tags: Optional[str],
+    enabled_only: bool
+) -> StatementLambdaElement:
+    """
+    为用例列表语句追加可选过滤条件（辅助函数）
+
+    使用 lambda 语句，SQLAlchemy 按代码位置缓存语句结构与编译结果，
+    每次请求只替换绑定参数。
+    """
+    # 搜索过滤
+    if search:
+        search_pattern = f"%{search}%"
+        stmt += lambda s: s.where(
+            (ApiTestCase.name.like(search_pattern)) |
+            (ApiTestCase.description.like(search_pattern))
+        )
+
+    # 标签过滤
+    if tags:
+        tag_list = tags.split(",")
+        stmt += lambda s: s.where(ApiTestCase.tags.contains(tag_list))
+
+    # 仅显示启用的
+    if enabled_only:
+        stmt += lambda s: s.where(ApiTestCase.enabled == True)
+
+    return stmt
+
+
 # ============================================================================
 # 测试用例 CRUD
 # ============================================================================
@@ -87,9 +185,8 @@ async def create_api_test_case(
     await verify_project_access(project_id, current_user, session)
 
     # 生成 YAML 内容
-    yaml_generator = YAMLGenerator()
     try:
-        yaml_content = yaml_generator.generate_yaml(test_case.config_data)
+        yaml_content = _yaml_generator.generate_yaml(test_case.config_data)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -111,6 +208,7 @@ async def create_api_test_case(
     session.add(db_test_case)
     await session.commit()
     await session.refresh(db_test_case)
+    _count_cache.clear()
 
     return db_test_case
 
@@ -123,6 +221,7 @@ async def list_api_test_cases(
     search: Optional[str] = None,
     tags: Optional[str] = None,
     enabled_only: bool = False,
+    with_count: bool = True,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(deps.get_current_user)
 ):
@@ -135,41 +234,37 @@ async def list_api_test_cases(
     - **search**: 搜索关键词（名称或描述）
     - **tags**: 标签过滤（逗号分隔）
     - **enabled_only**: 仅显示启用的用例
+    - **with_count**: 是否计算总数；翻页时可传 false 跳过 COUNT，依据 has_more 判断是否有下一页
     """
     # 验证项目存在
     await verify_project_access(project_id, current_user, session)
 
-    # 构建查询
-    query = select(ApiTestCase).where(
+    # 获取总数：直接对同一 WHERE 计数（不包子查询），并按过滤条件短时缓存
+    count_key = (project_id, search, tags, enabled_only)
+    total = _count_cache.get(count_key)
+    if total is None and with_count:
+        count_stmt = lambda_stmt(lambda: select(func.count(ApiTestCase.id)).where(
+            ApiTestCase.project_id == project_id,
+            ApiTestCase.is_deleted == False
+        ))
+        count_stmt = _apply_list_filters(count_stmt, search, tags, enabled_only)
+        total_result = await session.execute(count_stmt)
+        total = total_result.scalar()
+        _count_cache.set(count_key, total)
+
+    # 列表只返回摘要字段，不加载 yaml_content / config_data 大字段
+    query = lambda_stmt(lambda: select(ApiTestCase).options(
+        load_only(*_SUMMARY_COLUMNS)
+    ).where(
         ApiTestCase.project_id == project_id,
         ApiTestCase.is_deleted == False
-    )
-
-    # 搜索过滤
-    if search:
-        search_pattern = f"%{search}%"
-        query = query.where(
-            (ApiTestCase.name.like(search_pattern)) |
-            (ApiTestCase.description.like(search_pattern))
-        )
-
-    # 标签过滤
-    if tags:
-        tag_list = tags.split(",")
-        query = query.where(ApiTestCase.tags.contains(tag_list))
-
-    # 仅显示启用的
-    if enabled_only:
-        query = query.where(ApiTestCase.enabled == True)
+    ))
+    query = _apply_list_filters(query, search, tags, enabled_only)
 
-    # 获取总数
-    count_query = select(func.count()).select_from(query.subquery())
-    total_result = await session.execute(count_query)
-    total = total_result.scalar()
-
-    # 分页
-    query = query.offset((page - 1) * size).limit(size)
-    query = query.order_by(ApiTestCase.created_at.desc())
+    # 分页（多取一条用于判断是否还有下一页）
+    offset = (page - 1) * size
+    limit = size + 1
+    query += lambda s: s.order_by(ApiTestCase.created_at.desc()).offset(offset).limit(limit)
 
     # 执行查询
     result = await session.execute(query)
@@ -177,7 +272,8 @@ async def list_api_test_cases(
 
     return ApiTestCaseListResponse(
         total=total,
-        items=test_cases
+        has_more=len(test_cases) > size,
+        items=test_cases[:size]
     )
 
 
@@ -214,13 +310,13 @@ async def update_api_test_case(
 
     # 如果更新了 config_data，需要重新生成 YAML
     if "config_data" in update_data:
-        yaml_generator = YAMLGenerator()
         try:
-            # 合并现有配置和更新配置
-            config_data = {**test_case.config_data, **update_data["config_data"]}
-            yaml_content = yaml_generator.generate_yaml(config_data)
+            # 原地合并更新配置（JSON 列不跟踪原地修改，需显式标记为已修改）
+            config_data = test_case.config_data
+            config_data.update(update_data["config_data"])
+            yaml_content = _yaml_generator.generate_yaml(config_data)
             test_case.yaml_content = yaml_content
-            test_case.config_data = config_data
+            flag_modified(test_case, "config_data")
         except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -232,10 +328,9 @@ async def update_api_test_case(
         if field != "config_data":
             setattr(test_case, field, value)
 
-    test_case.updated_at = datetime.utcnow()
-
     await session.commit()
     await session.refresh(test_case)
+    _count_cache.clear()
 
     return test_case
 
@@ -255,6 +350,7 @@ async def delete_api_test_case(
     # 软删除
     test_case.is_deleted = True
     await session.commit()
+    _count_cache.clear()
 
     return {"message": f"测试用例已删除: {test_case.name}"}
 
@@ -265,53 +361,47 @@ async def delete_api_test_case(
 
 async def execute_test_case_background(
     test_case_id: int,
-    execution_request: ApiTestExecutionRequest,
-    session: AsyncSession
+    execution_id: int,
+    execution_request: ApiTestExecutionRequest
 ):
     """
     后台执行测试用例
 
+    请求级会话在响应返回后即被关闭，因此后台任务自行创建独立会话。
+
     Args:
         test_case_id: 测试用例 ID
+        execution_id: 执行记录 ID（由接口预先创建，状态为 pending）
         execution_request: 执行请求
-        session: 数据库会话
     """
-    # 获取测试用例
-    test_case = await session.get(ApiTestCase, test_case_id)
-    if not test_case:
-        return
-
-    # 创建执行记录
-    execution = ApiTestExecution(
-        test_case_id=test_case_id,
-        environment_id=execution_request.environment_id,
-        status="running",
-        execution_options=execution_request.execution_options,
-        started_at=datetime.utcnow()
-    )
-
-    session.add(execution)
-    await session.commit()
-    await session.refresh(execution)
+    async with async_session_maker() as session:
+        # 获取测试用例和执行记录
+        test_case = await session.get(ApiTestCase, test_case_id)
+        execution = await session.get(ApiTestExecution, execution_id)
+        if not test_case or not execution:
+            return
+
+        # 更新执行状态
+        execution.status = "running"
+        execution.started_at = datetime.now(timezone.utc)
+        await session.commit()
 
-    try:
-        # 执行测试
-        adapter = APIEngineAdapter()
-        result = adapter.execute_test_case(
-            test_case.yaml_content,
-            verbose=execution_request.verbose
-        )
+        try:
+            # 执行测试
+            result = await _engine_adapter.execute_test_case(
+                test_case.yaml_content,
+                verbose=execution_request.verbose
+            )
 
-        # 处理结果
-        processor = TestResultProcessor()
-        await processor.process_result(execution.id, result, session)
+            # 处理结果
+            await _result_processor.process_result(execution.id, result, session)
 
-    except Exception as e:
-        # 错误处理
-        execution.status = "error"
-        execution.error_message = str(e)
-        execution.completed_at = datetime.utcnow()
-        await session.commit()
+        except Exception as e:
+            # 错误处理
+            execution.status = "error"
+            execution.error_message = str(e)
+            execution.completed_at = datetime.now(timezone.utc)
+            await session.commit()
 
 
 @router.post("/api-test-cases/{test_case_id}/execute", response_model=ApiTestExecutionResponse)
@@ -350,8 +440,8 @@ async def execute_api_test_case(
     background_tasks.add_task(
         execute_test_case_background,
         test_case_id,
-        execution_request,
-        session
+        execution.id,
+        execution_request
     )
 
     return execution
@@ -371,9 +461,9 @@ async def list_test_executions(
     await verify_project_access(test_case.project_id, current_user, session)
 
     # 查询执行记录
-    query = select(ApiTestExecution).where(
+    query = lambda_stmt(lambda: select(ApiTestExecution).where(
         ApiTestExecution.test_case_id == test_case_id
-    ).order_by(ApiTestExecution.created_at.desc()).limit(limit)
+    ).order_by(ApiTestExecution.created_at.desc()).limit(limit))
 
     result = await session.execute(query)
     executions = result.scalars().all()
@@ -388,49 +478,79 @@ async def get_execution_detail(
     current_user: User = Depends(deps.get_current_user)
 ):
     """获取执行记录详情"""
-    execution = await session.get(ApiTestExecution, execution_id)
-    if not execution:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"执行记录不存在: {execution_id}"
-        )
-
-    # 验证项目访问权限
-    test_case = await session.get(ApiTestCase, execution.test_case_id)
-    if test_case:
-        await verify_project_access(test_case.project_id, current_user, session)
+    execution, _ = await get_execution_with_project(execution_id, current_user, session)
 
     return execution
 
 
-@router.get("/api-test-executions/{execution_id}/steps", response_model=List[ApiTestStepResultResponse])
+@router.get(
+    "/api-test-executions/{execution_id}/steps",
+    response_model=List[ApiTestStepResultResponse],
+    response_class=StreamingResponse,
+)
 async def get_execution_step_results(
     execution_id: int,
+    request: Request,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(deps.get_current_user)
 ):
-    """获取执行的步骤结果"""
-    execution = await session.get(ApiTestExecution, execution_id)
-    if not execution:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"执行记录不存在: {execution_id}"
+    """
+    获取执行的步骤结果
+
+    步骤结果使用服务端游标分批读取并逐行序列化，不在内存中物化整个列表。
+    默认返回 JSON 数组；请求头 Accept 为 application/x-ndjson 时按行返回，
+    便于前端渐进渲染。
+    """
+    # 获取执行记录并验证项目访问权限
+    await get_execution_with_project(execution_id, current_user, session)
+
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            _iter_step_results_ndjson(execution_id),
+            media_type=NDJSON_MEDIA_TYPE
         )
 
-    # 验证项目访问权限
-    test_case = await session.get(ApiTestCase, execution.test_case_id)
-    if test_case:
-        await verify_project_access(test_case.project_id, current_user, session)
+    return StreamingResponse(
+        _iter_step_results_json_array(execution_id),
+        media_type="application/json"
+    )
+
 
-    # 查询步骤结果
-    query = select(ApiTestStepResult).where(
+async def _iter_step_results(execution_id: int) -> AsyncIterator[bytes]:
+    """
+    按步骤顺序逐条产出已编码的步骤结果
+
+    StreamingResponse 不经过 response_model 校验，因此每行先按
+    ApiTestStepResultResponse 校验再编码，输出与声明的响应模型一致。
+    响应在依赖清理后才开始发送，因此使用独立的会话。
+    """
+    query = lambda_stmt(lambda: select(ApiTestStepResult).where(
         ApiTestStepResult.execution_id == execution_id
-    ).order_by(ApiTestStepResult.step_order)
+    ).order_by(ApiTestStepResult.step_order))
+
+    async with async_session_maker() as session:
+        steps = await session.stream_scalars(
+            query, execution_options={"yield_per": STEP_RESULT_BATCH_SIZE}
+        )
+        async for step in steps:
+            yield orjson.dumps(
+                ApiTestStepResultResponse.model_validate(step).model_dump(mode="json")
+            )
 
-    result = await session.execute(query)
-    step_results = result.scalars().all()
 
-    return step_results
+async def _iter_step_results_ndjson(execution_id: int) -> AsyncIterator[bytes]:
+    """以 NDJSON 格式输出步骤结果"""
+    async for line in _iter_step_results(execution_id):
+        yield line + b"\n"
+
+
+async def _iter_step_results_json_array(execution_id: int) -> AsyncIterator[bytes]:
+    """以 JSON 数组格式输出步骤结果"""
+    separator = b"["
+    async for item in _iter_step_results(execution_id):
+        yield separator + item
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
 
 
 # ============================================================================
@@ -443,15 +563,14 @@ async def validate_test_case_yaml(
     current_user: User = Depends(deps.get_current_user)
 ):
     """验证测试用例 YAML 语法"""
-    adapter = APIEngineAdapter()
-    is_valid = adapter.validate_yaml(request.yaml_content)
+    is_valid, _, errors = _engine_adapter.parse_and_validate_yaml(request.yaml_content)
 
     if is_valid:
         return ValidateYamlResponse(valid=True)
     else:
         return ValidateYamlResponse(
             valid=False,
-            errors=["YAML 语法错误或不符合 API Engine 规范"]
+            errors=errors
         )
 
 
@@ -466,25 +585,16 @@ async def import_from_yaml(
     # 验证项目存在
     await verify_project_access(project_id, current_user, session)
 
-    # 验证 YAML
-    adapter = APIEngineAdapter()
-    if not adapter.validate_yaml(request.yaml_content):
+    # 解析并验证 YAML（只解析一次，复用解析结果提取基本信息）
+    is_valid, yaml_data, _ = _engine_adapter.parse_and_validate_yaml(request.yaml_content)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="YAML 格式错误"
         )
 
-    # 解析 YAML 提取基本信息（简化版）
-    import yaml
-    try:
-        yaml_data = yaml.safe_load(request.yaml_content)
-        name = yaml_data.get("name", "导入的测试用例")
-        description = yaml_data.get("description", "")
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="无法解析 YAML"
-        )
+    name = yaml_data.get("name", "导入的测试用例")
+    description = yaml_data.get("description", "")
 
     # 创建测试用例
     db_test_case = ApiTestCase(
@@ -499,5 +609,6 @@ async def import_from_yaml(
     session.add(db_test_case)
     await session.commit()
     await session.refresh(db_test_case)
+    _count_cache.clear()
 
     return db_test_case
@@ -4,6 +4,7 @@ from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import Optional
+import asyncio
 import httpx
 import secrets
 
@@ -48,11 +49,11 @@ async def register(data: UserRegister, session: AsyncSession = Depends(get_sessi
             detail="该用户名已被使用"
         )
     
-    # 创建新用户
+    # 创建新用户（密码哈希在线程中执行，避免阻塞事件循环）
     user = User(
         username=data.username,
         email=data.email,
-        password_hash=get_password_hash(data.password)
+        password_hash=await asyncio.to_thread(get_password_hash, data.password)
     )
     session.add(user)
     await session.commit()
@@ -81,7 +82,9 @@ async def login(data: UserLogin, session: AsyncSession = Depends(get_session)):
     )
     user = result.scalar_one_or_none()
     
-    if not user or not user.password_hash or not verify_password(data.password, user.password_hash):
+    if not user or not user.password_hash or not await asyncio.to_thread(
+        verify_password, data.password, user.password_hash
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="邮箱或密码错误"
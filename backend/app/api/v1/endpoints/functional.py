@@ -1,44 +1,94 @@
 """
 功能测试 API 端点 - 用例管理
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, UploadFile, File
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Body, Request, UploadFile, File
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, cast, insert, lambda_stmt, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select, func
 from datetime import datetime
 import csv
 import io
-from app.core.db import get_session
-from app.models import Requirement, FunctionalTestCase
+import string
+import uuid
+import orjson
+from app.core.db import get_session, async_session_maker
+from app.core.network import get_llm_http_client
+from app.core.pagination import paginate
+from app.core.responses import negotiate_response
+from app.models import AIGenerationTask, Requirement, FunctionalTestCase
 from app.schemas.pagination import PageResponse
 
 router = APIRouter()
 
+# 导出用例时每批从游标读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 导入用例时每条多行 INSERT 写入的行数
+IMPORT_BATCH_SIZE = 500
+
+# 并发创建需求时编号冲突的最多尝试次数
+REQUIREMENT_ID_ATTEMPTS = 3
+
+# 用例生成提示词模板（模块加载时构建一次）
+_CASE_GENERATION_PROMPT = string.Template("""根据以下需求，生成详细的功能测试用例：
+
+需求编号: $requirement_id
+需求名称: $name
+需求描述: $description
+
+请生成测试用例，每个用例包含：
+- 用例标题
+- 优先级 (P0-P3)
+- 前置条件
+- 操作步骤 (表格形式: 步骤序号 | 操作步骤 | 预期结果)
+- 预期结果
+
+请以JSON格式返回，格式如下：
+{
+    "cases": [
+        {
+            "title": "用例标题",
+            "priority": "P1",
+            "precondition": "前置条件",
+            "steps": [
+                {"step": "步骤1", "expected": "预期结果1"},
+                {"step": "步骤2", "expected": "预期结果2"}
+            ],
+            "expected_result": "最终预期结果"
+        }
+    ]
+}
+""")
+
+# 更新用例时允许写入的列
+_CASE_UPDATABLE_COLUMNS = frozenset(FunctionalTestCase.__table__.columns.keys()) - {"id"}
+
 
 # ==================== 需求管理 ====================
 
 @router.get("/requirements", response_model=PageResponse[Requirement])
 async def list_requirements(
+    request: Request,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     project_id: int = Query(None),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，传入时使用游标分页"),
     session: AsyncSession = Depends(get_session)
 ):
     """获取需求列表"""
-    skip = (page - 1) * size
-    statement = select(Requirement)
-    count_statement = select(func.count()).select_from(Requirement)
+    statement = lambda_stmt(lambda: select(Requirement))
     
     if project_id:
-        statement = statement.where(Requirement.project_id == project_id)
-        count_statement = count_statement.where(Requirement.project_id == project_id)
+        statement += lambda s: s.where(Requirement.project_id == project_id)
     
-    total = (await session.execute(count_statement)).scalar()
-    result = await session.execute(statement.offset(skip).limit(size).order_by(Requirement.created_at.desc()))
-    items = result.scalars().all()
-    
-    return PageResponse(items=items, total=total, page=page, size=size, pages=(total + size - 1) // size)
+    page_data = await paginate(
+        session, statement, page, size,
+        keyset=(Requirement.created_at, Requirement.id), cursor=cursor
+    )
+    return negotiate_response(request, page_data)
 
 
 @router.post("/requirements", response_model=Requirement)
@@ -66,19 +116,28 @@ async def create_requirement(
     from datetime import datetime
     date_prefix = datetime.now().strftime("%Y%m%d")
 
-    # 查询当天已有的需求数量，生成序号
-    result = await session.execute(
-        select(Requirement).where(Requirement.requirement_id.like(f"REQ-{date_prefix}-%"))
-    )
-    existing_count = len(result.scalars().all())
-    seq_number = existing_count + 1
-    mapped_data["requirement_id"] = f"REQ-{date_prefix}-{seq_number:03d}"
+    # 取当天最大的序号生成新编号（前缀匹配走 requirement_id 唯一索引，只返回一个值）：
+    # 序号在 SQL 中转为整数再取最大值，超过 999 后字符串比较（"-1000" < "-999"）不再可靠；
+    # 删除需求后也不会复用编号
+    prefix = f"REQ-{date_prefix}-"
+    seq_column = cast(func.substr(Requirement.requirement_id, len(prefix) + 1), Integer)
 
-    requirement = Requirement(**mapped_data)
-    session.add(requirement)
-    await session.commit()
-    await session.refresh(requirement)
-    return requirement
+    # 读取最大序号与插入之间可能被并发请求抢占同一编号，唯一约束冲突时重新取号
+    for attempt in range(REQUIREMENT_ID_ATTEMPTS):
+        last_seq = (await session.execute(
+            select(func.max(seq_column)).where(Requirement.requirement_id.like(f"{prefix}%"))
+        )).scalar()
+        mapped_data["requirement_id"] = f"{prefix}{(last_seq or 0) + 1:03d}"
+
+        requirement = Requirement(**mapped_data)
+        session.add(requirement)
+        try:
+            await session.commit()
+            return requirement
+        except IntegrityError:
+            await session.rollback()
+
+    raise HTTPException(status_code=409, detail="需求编号生成冲突，请重试")
 
 
 @router.get("/requirements/{requirement_id}", response_model=Requirement)
@@ -111,30 +170,28 @@ async def delete_requirement(
 
 @router.get("/cases", response_model=PageResponse[FunctionalTestCase])
 async def list_cases(
+    request: Request,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     requirement_id: int = Query(None),
     priority: str = Query(None),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，传入时使用游标分页"),
     session: AsyncSession = Depends(get_session)
 ):
     """获取用例列表"""
-    skip = (page - 1) * size
-    statement = select(FunctionalTestCase)
-    count_statement = select(func.count()).select_from(FunctionalTestCase)
+    statement = lambda_stmt(lambda: select(FunctionalTestCase))
     
     if requirement_id:
-        statement = statement.where(FunctionalTestCase.requirement_id == requirement_id)
-        count_statement = count_statement.where(FunctionalTestCase.requirement_id == requirement_id)
+        statement += lambda s: s.where(FunctionalTestCase.requirement_id == requirement_id)
     
     if priority:
-        statement = statement.where(FunctionalTestCase.priority == priority)
-        count_statement = count_statement.where(FunctionalTestCase.priority == priority)
+        statement += lambda s: s.where(FunctionalTestCase.priority == priority)
     
-    total = (await session.execute(count_statement)).scalar()
-    result = await session.execute(statement.offset(skip).limit(size).order_by(FunctionalTestCase.created_at.desc()))
-    items = result.scalars().all()
-    
-    return PageResponse(items=items, total=total, page=page, size=size, pages=(total + size - 1) // size)
+    page_data = await paginate(
+        session, statement, page, size,
+        keyset=(FunctionalTestCase.created_at, FunctionalTestCase.id), cursor=cursor
+    )
+    return negotiate_response(request, page_data)
 
 
 @router.post("/cases", response_model=FunctionalTestCase)
@@ -146,7 +203,6 @@ async def create_case(
     case = FunctionalTestCase(**data)
     session.add(case)
     await session.commit()
-    await session.refresh(case)
     return case
 
 
@@ -169,17 +225,19 @@ async def update_case(
     session: AsyncSession = Depends(get_session)
 ):
     """更新用例"""
-    case = await session.get(FunctionalTestCase, case_id)
+    update_data = {key: value for key, value in data.items() if key in _CASE_UPDATABLE_COLUMNS}
+    update_data['updated_at'] = datetime.utcnow()
+    result = await session.execute(
+        update(FunctionalTestCase)
+        .where(FunctionalTestCase.id == case_id)
+        .values(**update_data)
+        .returning(FunctionalTestCase)
+    )
+    case = result.scalar_one_or_none()
     if not case:
         raise HTTPException(status_code=404, detail="用例不存在")
     
-    for key, value in data.items():
-        if hasattr(case, key):
-            setattr(case, key, value)
-    
-    case.updated_at = datetime.utcnow()
     await session.commit()
-    await session.refresh(case)
     return case
 
 
@@ -206,67 +264,143 @@ async def import_cases(
     session: AsyncSession = Depends(get_session)
 ):
     """导入用例 (CSV格式)"""
-    content = await file.read()
-    reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig')))
+    # 直接在上传的临时文件上逐行解析，不把整个文件读入内存；
+    # newline='' 交由 csv 模块处理换行，保证单元格内的换行被正确解析
+    text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
     
     imported = 0
-    for row in reader:
-        case = FunctionalTestCase(
-            requirement_id=requirement_id,
-            title=row.get('标题', row.get('title', '')),
-            priority=row.get('优先级', row.get('priority', 'P2')),
-            precondition=row.get('前置条件', row.get('precondition', '')),
-            expected_result=row.get('预期结果', row.get('expected_result', '')),
-            steps=[]  # 需要解析
-        )
-        session.add(case)
-        imported += 1
+    rows = []
+    try:
+        # 所有批次在同一个事务中写入，最后统一提交；任一批失败时整体回滚
+        # （请求会话可能已被鉴权依赖开启事务，因此不使用 session.begin()）
+        for row in reader:
+            precondition = row.get('前置条件', row.get('precondition', ''))
+            expected_result = row.get('预期结果', row.get('expected_result', ''))
+            rows.append(_new_case_row(
+                requirement_id,
+                title=row.get('标题', row.get('title', '')),
+                priority=row.get('优先级', row.get('priority', 'P2')),
+                preconditions=[precondition] if precondition else [],
+                steps=[{"step_number": 1, "action": "", "expected_result": expected_result}] if expected_result else [],
+            ))
+            if len(rows) >= IMPORT_BATCH_SIZE:
+                imported += await _bulk_insert_cases(session, rows)
+        
+        imported += await _bulk_insert_cases(session, rows)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        # 解除包装，避免包装器回收时关闭 UploadFile 的底层文件
+        text.detach()
     
-    await session.commit()
     return {"imported": imported}
 
 
+def _new_case_row(requirement_id: int, **fields) -> dict:
+    """构造一行待插入的用例数据（经模型填充默认值）"""
+    fields.setdefault("module_name", "")
+    fields.setdefault("page_name", "")
+    fields.setdefault("case_type", "functional")
+    fields.setdefault("created_by", 1)  # 默认用户ID为1
+    case = FunctionalTestCase(
+        case_id=f"TC-{datetime.now().strftime('%Y%m%d')}-{requirement_id:03d}-{uuid.uuid4().hex[:8]}",
+        requirement_id=requirement_id,
+        **fields
+    )
+    return case.model_dump(exclude={"id"})
+
+
+def _as_list(value) -> List[str]:
+    """将单个前置条件或前置条件列表统一为列表"""
+    if not value:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+async def _bulk_insert_cases(session: AsyncSession, rows: List[dict]) -> int:
+    """以单条多行 INSERT 批量写入用例并清空 rows，返回写入行数"""
+    if not rows:
+        return 0
+    count = len(rows)
+    await session.execute(insert(FunctionalTestCase), rows)
+    rows.clear()
+    return count
+
+
 @router.get("/cases/export")
 async def export_cases(
     requirement_id: int = Query(None),
     format: str = Query("csv"),
     session: AsyncSession = Depends(get_session)
 ):
-    """导出用例"""
-    statement = select(FunctionalTestCase)
+    """导出用例（逐行流式输出，内存占用与导出行数无关）"""
+    statement = select(
+        FunctionalTestCase.title,
+        FunctionalTestCase.priority,
+        FunctionalTestCase.preconditions,
+        FunctionalTestCase.steps,
+    )
     if requirement_id:
         statement = statement.where(FunctionalTestCase.requirement_id == requirement_id)
     
-    result = await session.execute(statement)
-    cases = result.scalars().all()
-    
-    # CSV 导出
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['标题', '优先级', '前置条件', '预期结果'])
-    
-    for case in cases:
-        writer.writerow([case.title, case.priority, case.precondition or '', case.expected_result or ''])
-    
-    output.seek(0)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _iter_cases_csv(statement),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=cases_{datetime.now().strftime('%Y%m%d')}.csv"}
     )
 
 
+async def _iter_cases_csv(statement) -> AsyncIterator[bytes]:
+    """
+    使用服务端游标逐批读取用例并编码为 CSV
+
+    响应在依赖清理后才开始发送，因此使用独立的会话。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow(['标题', '优先级', '前置条件', '预期结果'])
+    yield flush()
+
+    async with async_session_maker() as session:
+        result = await session.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            writer.writerows(
+                (
+                    title,
+                    priority,
+                    '\n'.join(preconditions or []),
+                    '\n'.join(step.get('expected_result', '') for step in steps or []),
+                )
+                for title, priority, preconditions, steps in rows
+            )
+            yield flush()
+
+
 # ==================== AI用例生成 ====================
 
 @router.post("/ai/generate")
 async def generate_cases_with_ai(
+    background_tasks: BackgroundTasks,
     requirement_id: int = Body(..., embed=True),
     model: str = Body("gpt-4o-mini", embed=True),
     session: AsyncSession = Depends(get_session)
 ):
-    """使用AI生成测试用例"""
-    import os
-    
+    """
+    使用AI生成测试用例
+
+    只创建任务记录并立即返回，LLM 调用在后台执行；
+    客户端通过 GET /ai/tasks/{task_id} 轮询任务状态与结果。
+    """
     # 获取需求
     requirement = await session.get(Requirement, requirement_id)
     if not requirement:
@@ -276,67 +410,85 @@ async def generate_cases_with_ai(
     task = AIGenerationTask(
         requirement_id=requirement_id,
         model=model,
-        status="running"
+        status="pending"
     )
     session.add(task)
     await session.commit()
-    await session.refresh(task)
     
-    # 构建提示词
-    prompt = f"""根据以下需求，生成详细的功能测试用例：
+    background_tasks.add_task(
+        _run_ai_generation_job,
+        task.id,
+        _build_case_generation_prompt(requirement),
+        requirement.name,
+        model
+    )
+    
+    return task
 
-需求编号: {requirement.requirement_id}
-需求名称: {requirement.name}
-需求描述: {requirement.description or '无'}
 
-请生成测试用例，每个用例包含：
-- 用例标题
-- 优先级 (P0-P3)
-- 前置条件
-- 操作步骤 (表格形式: 步骤序号 | 操作步骤 | 预期结果)
-- 预期结果
+@router.get("/ai/tasks/{task_id}")
+async def get_ai_generation_task(
+    task_id: int,
+    session: AsyncSession = Depends(get_session)
+):
+    """获取AI生成任务状态与结果"""
+    task = await session.get(AIGenerationTask, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return task
 
-请以JSON格式返回，格式如下：
-{{
-    "cases": [
-        {{
-            "title": "用例标题",
-            "priority": "P1",
-            "precondition": "前置条件",
-            "steps": [
-                {{"step": "步骤1", "expected": "预期结果1"}},
-                {{"step": "步骤2", "expected": "预期结果2"}}
-            ],
-            "expected_result": "最终预期结果"
-        }}
-    ]
-}}
-"""
+
+def _build_case_generation_prompt(requirement: Requirement) -> str:
+    """构建用例生成提示词"""
+    return _CASE_GENERATION_PROMPT.substitute(
+        requirement_id=requirement.requirement_id,
+        name=requirement.name,
+        description=requirement.description or '无'
+    )
+
+
+async def _run_ai_generation_job(
+    task_id: int,
+    prompt: str,
+    requirement_name: str,
+    model: str
+):
+    """
+    后台执行AI用例生成并更新任务记录
+
+    请求级会话在响应返回后已关闭，因此使用独立的会话。
+    """
+    import os
     
-    try:
-        # 调用 LLM API
-        llm_api_key = os.getenv("LLM_API_KEY", "")
-        if not llm_api_key or llm_api_key == "your_api_key_here":
-            # 模拟返回
-            result = {
-                "cases": [
-                    {
-                        "title": f"验证{requirement.name}基本功能",
-                        "priority": "P1",
-                        "precondition": "用户已登录系统",
-                        "steps": [
-                            {"step": "进入相关功能页面", "expected": "页面正常显示"},
-                            {"step": "执行核心操作", "expected": "操作成功"}
-                        ],
-                        "expected_result": "功能正常运行"
-                    }
-                ]
-            }
-        else:
-            # 真实调用 OpenAI
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+    async with async_session_maker() as session:
+        task = await session.get(AIGenerationTask, task_id)
+        if not task:
+            return
+        task.status = "running"
+        await session.commit()
+        
+        try:
+            # 调用 LLM API
+            llm_api_key = os.getenv("LLM_API_KEY", "")
+            if not llm_api_key or llm_api_key == "your_api_key_here":
+                # 模拟返回
+                result = {
+                    "cases": [
+                        {
+                            "title": f"验证{requirement_name}基本功能",
+                            "priority": "P1",
+                            "precondition": "用户已登录系统",
+                            "steps": [
+                                {"step": "进入相关功能页面", "expected": "页面正常显示"},
+                                {"step": "执行核心操作", "expected": "操作成功"}
+                            ],
+                            "expected_result": "功能正常运行"
+                        }
+                    ]
+                }
+            else:
+                # 真实调用 OpenAI（共享客户端，复用已建立的连接）
+                response = await get_llm_http_client().post(
                     "https://api.openai.com/v1/chat/completions",
                     headers={"Authorization": f"Bearer {llm_api_key}"},
                     json={
@@ -346,22 +498,18 @@ async def generate_cases_with_ai(
                     },
                     timeout=60
                 )
-                result = response.json()["choices"][0]["message"]["content"]
-                import json
-                result = json.loads(result)
-        
-        task.status = "completed"
-        task.result = result
-        task.completed_at = datetime.utcnow()
-        
-    except Exception as e:
-        task.status = "failed"
-        task.error_message = str(e)
-    
-    await session.commit()
-    await session.refresh(task)
-    
-    return task
+                result = orjson.loads(response.content)["choices"][0]["message"]["content"]
+                result = orjson.loads(result)
+
+            task.status = "completed"
+            task.result = result
+            task.completed_at = datetime.utcnow()
+
+        except Exception as e:
+            task.status = "failed"
+            task.error_message = str(e)
+
+        await session.commit()
 
 
 @router.post("/ai/import-to-cases")
@@ -377,20 +525,20 @@ async def import_ai_result_to_cases(
     if task.status != "completed":
         raise HTTPException(status_code=400, detail="任务未完成")
     
-    cases_data = task.result.get("cases", [])
-    imported = 0
-    
-    for case_data in cases_data:
-        case = FunctionalTestCase(
-            requirement_id=task.requirement_id,
+    rows = [
+        _new_case_row(
+            task.requirement_id,
             title=case_data.get("title", ""),
             priority=case_data.get("priority", "P2"),
-            precondition=case_data.get("precondition", ""),
+            module_name=case_data.get("module_name", ""),
+            page_name=case_data.get("page_name", ""),
+            preconditions=_as_list(case_data.get("preconditions", case_data.get("precondition"))),
             steps=case_data.get("steps", []),
-            expected_result=case_data.get("expected_result", "")
+            is_ai_generated=True,
         )
-        session.add(case)
-        imported += 1
+        for case_data in task.result.get("cases", [])
+    ]
+    imported = await _bulk_insert_cases(session, rows)
     
     await session.commit()
     return {"imported": imported}
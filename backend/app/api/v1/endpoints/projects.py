@@ -1,10 +1,14 @@
-from typing import List
+import asyncio
+from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import select, func
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from sqlalchemy import insert, lambda_stmt, literal, update
+from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.hash import bcrypt
-from app.core.db import get_session
+from app.core.db import get_session, async_session_maker
+from app.core.pagination import paginate
+from app.core.responses import negotiate_response
 from app.api import deps
 from app.models.project import Project, ProjectEnvironment, ProjectDataSource
 from app.schemas.pagination import PageResponse
@@ -17,42 +21,34 @@ from app.schemas.environment import (
 
 router = APIRouter()
 
+# 数据源连接测试的 TCP 探测超时与 MySQL 认证超时（秒）
+TCP_PROBE_TIMEOUT = 2.0
+MYSQL_CONNECT_TIMEOUT = 3
+
 
 # ============================================
 # Project CRUD
 # ============================================
 @router.get("/", response_model=PageResponse[Project])
 async def read_projects(
+    request: Request,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     name: str = Query(None, description="Project name search term"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; enables keyset pagination"),
     session: AsyncSession = Depends(get_session)
 ):
-    # Base query
-    query = select(Project)
+    # Base query (lambda statement: compiled SQL is cached per query shape)
+    statement = lambda_stmt(lambda: select(Project))
     if name:
-        query = query.where(Project.name.contains(name))
+        statement += lambda s: s.where(Project.name.contains(name))
 
-    # Count
-    count_statement = select(func.count()).select_from(query.subquery())
-    total = (await session.execute(count_statement)).scalar()
-    
-    # Pagination
-    skip = (page - 1) * size
-    statement = query.order_by(Project.updated_at.desc()).offset(skip).limit(size)
-    result = await session.execute(statement)
-    projects = result.scalars().all()
-    
-    # Calculate pages
-    pages = (total + size - 1) // size
-    
-    return PageResponse(
-        items=projects,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
+    # Pagination (rows + total in one query, or keyset pagination with a cursor)
+    page_data = await paginate(
+        session, statement, page, size,
+        keyset=(Project.updated_at, Project.id), cursor=cursor
     )
+    return negotiate_response(request, page_data)
 
 @router.post("/", response_model=Project)
 async def create_project(
@@ -76,7 +72,6 @@ async def create_project(
 
     session.add(new_project)
     await session.commit()
-    await session.refresh(new_project)
     return new_project
 
 @router.put("/{project_id}", response_model=Project)
@@ -90,20 +85,20 @@ async def update_project(
     - **name**: 项目名称，1-50个字符
     - **description**: 项目描述，最多200个字符
     """
-    project = await session.get(Project, project_id)
+    # 单条 UPDATE ... RETURNING 完成更新并取回最新数据
+    update_data = {
+        key: value for key, value in project_update.model_dump(exclude_unset=True).items()
+        if key not in ('id', 'created_at', 'updated_at')
+    }
+    update_data['updated_at'] = datetime.utcnow()
+    result = await session.execute(
+        update(Project).where(Project.id == project_id).values(**update_data).returning(Project)
+    )
+    project = result.scalar_one_or_none()
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
 
-    # Update fields
-    update_data = project_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        if hasattr(project, key) and key not in ['id', 'created_at', 'updated_at']:
-            setattr(project, key, value)
-
-    project.updated_at = datetime.utcnow()
-    session.add(project)
     await session.commit()
-    await session.refresh(project)
     return project
 
 @router.get("/{project_id}", response_model=Project)
@@ -163,7 +158,6 @@ async def create_environment(
     )
     session.add(db_env)
     await session.commit()
-    await session.refresh(db_env)
     return db_env
 
 @router.get("/{project_id}/environments/{env_id}", response_model=EnvironmentResponse)
@@ -186,18 +180,19 @@ async def update_environment(
     session: AsyncSession = Depends(get_session)
 ):
     """更新环境配置"""
-    env = await session.get(ProjectEnvironment, env_id)
-    if not env or env.project_id != project_id:
-        raise HTTPException(status_code=404, detail="Environment not found")
-    
     update_data = env_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(env, key, value)
-    env.updated_at = datetime.utcnow()
+    update_data['updated_at'] = datetime.utcnow()
+    result = await session.execute(
+        update(ProjectEnvironment)
+        .where(ProjectEnvironment.id == env_id, ProjectEnvironment.project_id == project_id)
+        .values(**update_data)
+        .returning(ProjectEnvironment)
+    )
+    env = result.scalar_one_or_none()
+    if not env:
+        raise HTTPException(status_code=404, detail="Environment not found")
     
-    session.add(env)
     await session.commit()
-    await session.refresh(env)
     return env
 
 @router.delete("/{project_id}/environments/{env_id}")
@@ -222,21 +217,30 @@ async def copy_environment(
     session: AsyncSession = Depends(get_session)
 ):
     """深拷贝环境配置"""
-    env = await session.get(ProjectEnvironment, env_id)
-    if not env or env.project_id != project_id:
-        raise HTTPException(status_code=404, detail="Environment not found")
-    
-    # 创建副本
-    new_env = ProjectEnvironment(
-        project_id=project_id,
-        name=f"{env.name} (Copy)",
-        domain=env.domain,
-        variables=dict(env.variables),  # 深拷贝字典
-        headers=dict(env.headers)
+    # INSERT ... SELECT 在数据库内完成复制，变量与请求头 JSON 不经过应用往返
+    now = datetime.utcnow()
+    source = select(
+        literal(project_id),
+        ProjectEnvironment.name + " (Copy)",
+        ProjectEnvironment.domain,
+        ProjectEnvironment.variables,
+        ProjectEnvironment.headers,
+        literal(now),
+        literal(now),
+    ).where(ProjectEnvironment.id == env_id, ProjectEnvironment.project_id == project_id)
+    result = await session.execute(
+        insert(ProjectEnvironment)
+        .from_select(
+            ["project_id", "name", "domain", "variables", "headers", "created_at", "updated_at"],
+            source
+        )
+        .returning(ProjectEnvironment)
     )
-    session.add(new_env)
+    new_env = result.scalar_one_or_none()
+    if not new_env:
+        raise HTTPException(status_code=404, detail="Environment not found")
+
     await session.commit()
-    await session.refresh(new_env)
     return new_env
 
 
@@ -257,34 +261,20 @@ async def list_datasources(
 async def create_datasource(
     project_id: int,
     ds: DataSourceCreate,
+    background_tasks: BackgroundTasks,
     session: AsyncSession = Depends(get_session)
 ):
-    """创建新数据源"""
-    from app.core.network import test_mysql_connection
-    from datetime import datetime
+    """
+    创建新数据源
 
+    数据源先以 unchecked 状态保存并立即返回，连接测试在后台执行后再更新状态。
+    """
     project = await session.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # 加密密码
-    password_hash = bcrypt.hash(ds.password) if ds.password else ""
-
-    # 尝试测试连接以确定初始状态
-    status = "unchecked"
-    error_msg = None
-    last_test_at = datetime.utcnow()
-
-    if ds.username and ds.password:
-        success, message = await test_mysql_connection(
-            host=ds.host,
-            port=ds.port,
-            username=ds.username,
-            password=ds.password,
-            database=ds.db_name if ds.db_name else None
-        )
-        status = "connected" if success else "error"
-        error_msg = None if success else message
+    # 加密密码：bcrypt 是 CPU 密集操作，放到线程中执行避免阻塞事件循环
+    password_hash = await asyncio.to_thread(bcrypt.hash, ds.password) if ds.password else ""
 
     db_ds = ProjectDataSource(
         project_id=project_id,
@@ -297,15 +287,49 @@ async def create_datasource(
         password_hash=password_hash,
         variable_name=ds.variable_name,
         is_enabled=ds.is_enabled,
-        status=status,
-        last_test_at=last_test_at,
-        error_msg=error_msg
+        status="unchecked",
+        last_test_at=datetime.utcnow(),
+        error_msg=None
     )
     session.add(db_ds)
     await session.commit()
-    await session.refresh(db_ds)
+
+    # 后台测试连接以确定初始状态
+    if ds.username and ds.password:
+        background_tasks.add_task(
+            _probe_datasource,
+            db_ds.id,
+            host=ds.host,
+            port=ds.port,
+            username=ds.username,
+            password=ds.password,
+            database=ds.db_name if ds.db_name else None
+        )
+
     return db_ds
 
+
+async def _probe_datasource(ds_id: int, **connection) -> None:
+    """
+    测试数据源连接并更新其状态
+
+    在后台任务中执行，请求级会话已关闭，因此使用独立的会话。
+    """
+    from app.core.network import test_mysql_connection
+
+    success, message = await test_mysql_connection(**connection)
+    async with async_session_maker() as session:
+        await session.execute(
+            update(ProjectDataSource)
+            .where(ProjectDataSource.id == ds_id)
+            .values(
+                status="connected" if success else "error",
+                error_msg=None if success else message,
+                last_test_at=datetime.utcnow()
+            )
+        )
+        await session.commit()
+
 @router.put("/{project_id}/datasources/{ds_id}", response_model=DataSourceResponse)
 async def update_datasource(
     project_id: int,
@@ -314,12 +338,6 @@ async def update_datasource(
     session: AsyncSession = Depends(get_session)
 ):
     """更新数据源"""
-    from app.core.network import test_mysql_connection
-
-    ds = await session.get(ProjectDataSource, ds_id)
-    if not ds or ds.project_id != project_id:
-        raise HTTPException(status_code=404, detail="DataSource not found")
-
     update_data = ds_update.model_dump(exclude_unset=True)
 
     # 特殊处理密码字段
@@ -327,30 +345,29 @@ async def update_datasource(
     if 'password' in update_data:
         password = update_data.pop('password')
         if password:
-            ds.password_hash = bcrypt.hash(password)
+            # bcrypt 是 CPU 密集操作，放到线程中执行避免阻塞事件循环
+            update_data['password_hash'] = await asyncio.to_thread(bcrypt.hash, password)
             password_updated = True
 
-    # 检查是否需要重新测试连接（配置发生变化）
-    should_retest = any(key in update_data for key in ['host', 'port', 'username', 'db_name']) or password_updated
-
-    for key, value in update_data.items():
-        setattr(ds, key, value)
-    ds.updated_at = datetime.utcnow()
-
-    # 如果连接配置发生变化，重新测试连接
-    if should_retest and ds.username and ds.password_hash:
-        # 注意：这里需要使用原始密码，但update时密码已经被加密了
-        # 所以我们只在password字段有值时才测试
-        if 'password' in ds_update or any(key in update_data for key in ['host', 'port', 'username', 'db_name']):
-            # 如果没有提供新密码，使用现有密码哈希（但无法解密，所以无法测试）
-            # 这里简化处理：只在提供了新密码或相关配置变更时标记为unchecked
-            ds.status = "unchecked"
-            ds.error_msg = None
-            ds.last_test_at = datetime.utcnow()
-
-    session.add(ds)
+    now = datetime.utcnow()
+    update_data['updated_at'] = now
+
+    # 连接配置发生变化时，原有的连接测试结果不再有效，标记为待检测
+    # （密码已加密存储，无法用现有密码重新测试）
+    if password_updated or any(key in update_data for key in ['host', 'port', 'username', 'db_name']):
+        update_data.update(status="unchecked", error_msg=None, last_test_at=now)
+
+    result = await session.execute(
+        update(ProjectDataSource)
+        .where(ProjectDataSource.id == ds_id, ProjectDataSource.project_id == project_id)
+        .values(**update_data)
+        .returning(ProjectDataSource)
+    )
+    ds = result.scalar_one_or_none()
+    if not ds:
+        raise HTTPException(status_code=404, detail="DataSource not found")
+
     await session.commit()
-    await session.refresh(ds)
     return ds
 
 @router.delete("/{project_id}/datasources/{ds_id}")
@@ -382,10 +399,14 @@ async def test_datasource_connection(
             message="主机地址和端口不能为空"
         )
 
+    # 先做快速 TCP 探测：主机不可达时不必等待 MySQL 驱动的连接超时
+    tcp_ok, tcp_message = await test_tcp_connection(
+        test_req.host, test_req.port, timeout=TCP_PROBE_TIMEOUT
+    )
+
     # 如果没有提供用户名或密码，只测试 TCP 连接
     if not test_req.username or not test_req.password:
-        success, message = test_tcp_connection(test_req.host, test_req.port)
-        if success:
+        if tcp_ok:
             return DataSourceTestResponse(
                 success=True,
                 message=f"TCP 连接成功 ({test_req.host}:{test_req.port})，但未提供数据库账号，无法验证数据库连接"
@@ -393,20 +414,26 @@ async def test_datasource_connection(
         else:
             return DataSourceTestResponse(
                 success=False,
-                message=f"TCP 连接失败: {message}"
+                message=f"TCP 连接失败: {tcp_message}"
             )
 
+    if not tcp_ok:
+        return DataSourceTestResponse(
+            success=False,
+            message=f"TCP 不可达: {tcp_message}"
+        )
+
     # 测试 MySQL 数据库连接
     success, message = await test_mysql_connection(
         host=test_req.host,
         port=test_req.port,
         username=test_req.username,
         password=test_req.password,
-        database=test_req.db_name
+        database=test_req.db_name,
+        timeout=MYSQL_CONNECT_TIMEOUT
     )
 
     return DataSourceTestResponse(
         success=success,
         message=message
     )
-
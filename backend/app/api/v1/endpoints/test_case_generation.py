@@ -2,11 +2,20 @@
 测试用例生成API - 功能测试模块
 提供AI生成测试用例的接口
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import TypeAdapter
+from sqlalchemy import delete, func, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.db import get_session
+from app.core.responses import (
+    PRIVATE_CACHE_CONTROL,
+    is_not_modified,
+    not_modified_response,
+    weak_etag
+)
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.models.functional_test_case import FunctionalTestCase
@@ -20,6 +29,28 @@ from sqlmodel import select
 
 router = APIRouter(tags=["测试用例生成"])
 
+# 批量校验/序列化用例列表，避免逐行构造模型
+_TC_ADAPTER = TypeAdapter(List[GeneratedTestCase])
+
+# 按需求分页查询用例时每页的默认/最大条数
+CASES_PAGE_SIZE = 100
+CASES_PAGE_MAX_SIZE = 500
+
+# 下一页游标的响应头
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _decode_case_cursor(cursor: str) -> Tuple[str, int]:
+    """解析 "优先级|id" 格式的游标"""
+    try:
+        priority, case_pk = cursor.rsplit("|", 1)
+        return priority, int(case_pk)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
 
 @router.post("/generate", response_model=TestCaseGenerationResult)
 async def generate_test_cases(
@@ -68,48 +99,82 @@ async def generate_test_cases(
 
 @router.get("/requirement/{requirement_id}", response_model=List[GeneratedTestCase])
 async def get_test_cases_by_requirement(
+    request: Request,
     requirement_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=CASES_PAGE_MAX_SIZE, description="每页条数，不传且无 after 时返回全部"),
+    after: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 返回的游标"),
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取指定需求的所有测试用例
+    获取指定需求的测试用例
 
-    返回该需求关联的所有测试用例
+    按 (优先级, id) 顺序返回该需求关联的测试用例。未传 limit 和 after 时返回全部用例；
+    传入任一参数时分页返回，每次最多 limit 条（默认 CASES_PAGE_SIZE）。
+    还有下一页时通过 X-Next-Cursor 响应头返回游标，作为下次请求的 after 参数，
+    借助 (requirement_id, priority, id) 索引直接定位，无需扫描前面的行。
+
+    响应带有由最大更新时间和用例数生成的 ETag，
+    If-None-Match 命中时直接返回 304，不再查询和序列化用例列表。
     """
-    result = await session.execute(
-        select(FunctionalTestCase)
+    cursor = _decode_case_cursor(after) if after else None
+    if limit is None and after is not None:
+        limit = CASES_PAGE_SIZE
+
+    version = (await session.execute(
+        select(func.max(FunctionalTestCase.updated_at), func.count())
+        .where(FunctionalTestCase.requirement_id == requirement_id)
+    )).one()
+    etag = weak_etag(requirement_id, limit, after, *version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # 只查询所需列并以字典行返回，跳过 ORM 实体构建与身份映射
+    statement = (
+        select(
+            FunctionalTestCase.id,
+            FunctionalTestCase.module_name,
+            FunctionalTestCase.page_name,
+            FunctionalTestCase.title,
+            FunctionalTestCase.priority,
+            FunctionalTestCase.case_type,
+            FunctionalTestCase.preconditions,
+            FunctionalTestCase.steps,
+            FunctionalTestCase.tags,
+            FunctionalTestCase.estimated_time,
+            FunctionalTestCase.complexity
+        )
         .where(FunctionalTestCase.requirement_id == requirement_id)
         .order_by(FunctionalTestCase.priority, FunctionalTestCase.id)
     )
-    test_cases = result.scalars().all()
-
-    return [
-        GeneratedTestCase(
-            module_name=case.module_name,
-            page_name=case.page_name,
-            title=case.title,
-            priority=case.priority,
-            case_type=case.case_type,
-            preconditions=case.preconditions or [],
-            steps=[
-                {
-                    "step_number": step["step_number"],
-                    "action": step["action"],
-                    "expected_result": step["expected_result"]
-                }
-                for step in case.steps
-            ],
-            tags=case.tags or [],
-            estimated_time=case.estimated_time,
-            complexity=case.complexity
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    if cursor:
+        statement = statement.where(
+            tuple_(FunctionalTestCase.priority, FunctionalTestCase.id) > tuple_(*cursor)
         )
-        for case in test_cases
-    ]
+    result = await session.execute(statement)
+    rows = result.mappings().all()
+
+    headers = {"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL}
+    # 多取的一行仅用于判断是否还有下一页
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = f"{rows[-1]['priority']}|{rows[-1]['id']}"
+
+    test_cases = _TC_ADAPTER.validate_python(rows)
+
+    return Response(
+        _TC_ADAPTER.dump_json(test_cases),
+        media_type="application/json",
+        headers=headers
+    )
 
 
 @router.get("/{case_id}")
 async def get_test_case(
+    request: Request,
+    response: Response,
     case_id: str,
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
@@ -117,38 +182,59 @@ async def get_test_case(
     """
     获取指定测试用例的详情
 
-    返回用例的完整信息，包括所有步骤
+    返回用例的完整信息，包括所有步骤。ETag 由更新时间生成，If-None-Match 命中时返回 304
     """
+    updated_at = (await session.execute(
+        select(FunctionalTestCase.updated_at)
+        .where(FunctionalTestCase.case_id == case_id)
+    )).scalar_one_or_none()
+    if updated_at is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="测试用例不存在"
+        )
+
+    etag = weak_etag(case_id, updated_at)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # 按唯一索引 case_id 只查询响应需要的列，以字典行返回，不构建 ORM 实体
     result = await session.execute(
-        select(FunctionalTestCase)
+        select(
+            FunctionalTestCase.id,
+            FunctionalTestCase.case_id,
+            FunctionalTestCase.requirement_id,
+            FunctionalTestCase.module_name,
+            FunctionalTestCase.page_name,
+            FunctionalTestCase.title,
+            FunctionalTestCase.priority,
+            FunctionalTestCase.case_type,
+            FunctionalTestCase.preconditions,
+            FunctionalTestCase.steps,
+            FunctionalTestCase.tags,
+            FunctionalTestCase.estimated_time,
+            FunctionalTestCase.complexity,
+            FunctionalTestCase.is_ai_generated,
+            FunctionalTestCase.status,
+            FunctionalTestCase.created_at,
+            FunctionalTestCase.updated_at
+        )
         .where(FunctionalTestCase.case_id == case_id)
     )
-    test_case = result.scalar_one_or_none()
+    test_case = result.mappings().one_or_none()
 
-    if not test_case:
+    if test_case is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="测试用例不存在"
         )
 
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
     return {
-        "id": test_case.id,
-        "case_id": test_case.case_id,
-        "requirement_id": test_case.requirement_id,
-        "module_name": test_case.module_name,
-        "page_name": test_case.page_name,
-        "title": test_case.title,
-        "priority": test_case.priority,
-        "case_type": test_case.case_type,
-        "preconditions": test_case.preconditions or [],
-        "steps": test_case.steps,
-        "tags": test_case.tags or [],
-        "estimated_time": test_case.estimated_time,
-        "complexity": test_case.complexity,
-        "is_ai_generated": test_case.is_ai_generated,
-        "status": test_case.status,
-        "created_at": test_case.created_at,
-        "updated_at": test_case.updated_at,
+        **test_case,
+        "preconditions": test_case["preconditions"] or [],
+        "tags": test_case["tags"] or [],
     }
 
 
@@ -163,19 +249,18 @@ async def delete_test_case(
 
     删除指定的测试用例
     """
+    # 单条 DELETE ... RETURNING，未返回行即用例不存在
     result = await session.execute(
-        select(FunctionalTestCase)
+        delete(FunctionalTestCase)
         .where(FunctionalTestCase.case_id == case_id)
+        .returning(FunctionalTestCase.id)
     )
-    test_case = result.scalar_one_or_none()
-
-    if not test_case:
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="测试用例不存在"
         )
 
-    await session.delete(test_case)
     await session.commit()
 
     return {"message": "测试用例已删除", "case_id": case_id}
@@ -193,24 +278,23 @@ async def approve_test_case(
     将测试用例状态从draft改为approved
     """
     result = await session.execute(
-        select(FunctionalTestCase)
+        update(FunctionalTestCase)
         .where(FunctionalTestCase.case_id == case_id)
+        .values(status="approved", updated_at=datetime.utcnow())
+        .returning(FunctionalTestCase.case_id, FunctionalTestCase.status)
     )
-    test_case = result.scalar_one_or_none()
+    row = result.first()
 
-    if not test_case:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="测试用例不存在"
         )
 
-    # 更新状态
-    test_case.status = "approved"
     await session.commit()
-    await session.refresh(test_case)
 
     return {
         "message": "测试用例已审核通过",
         "case_id": case_id,
-        "status": test_case.status
+        "status": row.status
     }
@@ -4,6 +4,7 @@
 """
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.db import get_session
@@ -107,15 +108,17 @@ async def delete_test_point(
 
     删除指定的测试点
     """
-    test_point = await session.get(TestPoint, test_point_id)
-
-    if not test_point:
+    result = await session.execute(
+        delete(TestPoint)
+        .where(TestPoint.id == test_point_id)
+        .returning(TestPoint.id)
+    )
+    if result.first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="测试点不存在"
         )
 
-    await session.delete(test_point)
     await session.commit()
 
     return {"message": "测试点已删除"}
@@ -13,10 +13,26 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    # 通过 PgBouncer（事务模式）连接时不使用应用侧连接池，并关闭 asyncpg 的预编译语句缓存
+    DB_PGBOUNCER: bool = False
+    # 是否打印所有 SQL（仅用于调试，高并发下日志开销显著）
+    DB_ECHO: bool = False
+
+    # API 引擎：JSON 输出时通过标准输入传递用例，不写临时文件（需要引擎支持 --cases -）
+    API_ENGINE_STDIN_CASES: bool = False
 
     # Redis
     REDIS_URL: Optional[str] = "redis://localhost:6379/0"
 
+    # LLM 响应缓存：memory / sqlite / redis（使用 REDIS_URL），none 表示关闭
+    LLM_CACHE_BACKEND: str = "memory"
+    LLM_CACHE_SIZE: int = 1024
+    LLM_CACHE_SQLITE_PATH: str = ".llm_cache.db"
+
     # MinIO
     MINIO_ENDPOINT: Optional[str] = "localhost:9000"
     MINIO_ACCESS_KEY: Optional[str] = "minioadmin"
@@ -1,6 +1,7 @@
 from sqlmodel import SQLModel
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from typing import AsyncGenerator
 from app.core.config import settings
 # 导入所有模型，确保 SQLModel.metadata 包含所有表定义
@@ -9,7 +10,7 @@ from app.models import (
     TestScenario, TestCase, Keyword,
     TestReport, TestReportDetail, TestPlan,
     # 功能测试模块模型
-    AIProviderConfig, Requirement, AIConversation,
+    AIProviderConfig, Requirement, AIConversation, AIGenerationTask,
     TestPoint, FunctionalTestCase, TestCaseKnowledge,
     TestCaseTemplate, FileAttachment
 )
@@ -18,10 +19,37 @@ from app.models import (
 # 判断是否使用 SQLite（本地开发）或 PostgreSQL（生产）
 if "sqlite" in settings.DATABASE_URL:
     # SQLite 需要使用 aiosqlite
-    engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
+    engine = create_async_engine(settings.DATABASE_URL, echo=settings.DB_ECHO, future=True)
+elif settings.DB_PGBOUNCER:
+    # PgBouncer（事务模式）已负责连接池：应用侧不再池化，避免双重池化；
+    # asyncpg 的预编译语句缓存在事务池模式下不可用
+    connect_args = {}
+    if "asyncpg" in settings.DATABASE_URL:
+        connect_args["statement_cache_size"] = 0
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.DB_ECHO,
+        future=True,
+        poolclass=NullPool,
+        connect_args=connect_args,
+    )
 else:
     # PostgreSQL Connection
-    engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.DB_ECHO,
+        future=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+# 会话工厂：请求依赖与后台任务共用
+async_session_maker = sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False
+)
 
 async def init_db():
     async with engine.begin() as conn:
@@ -29,8 +57,5 @@ async def init_db():
         await conn.run_sync(SQLModel.metadata.create_all)
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+    async with async_session_maker() as session:
         yield session
@@ -1,31 +1,183 @@
-import socket
 import asyncio
+import hashlib
+import importlib.util
 import logging
+import time
+from collections import OrderedDict
 import aiomysql
+import httpx
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-def test_tcp_connection(host: str, port: int, timeout: int = 5) -> tuple[bool, str]:
+# 测试数据源连接使用的 MySQL 连接池，按连接参数缓存
+MYSQL_POOL_MAXSIZE = 8
+MYSQL_POOL_RECYCLE = 300
+# 最多缓存的连接池数与空闲淘汰时间（秒），被淘汰的连接池会被关闭
+MYSQL_POOL_CACHE_SIZE = 32
+MYSQL_POOL_IDLE_TTL = 600
+# 连接参数摘要 -> (连接池, 最近使用时间)，按最近使用排序（LRU）
+_mysql_pools: "OrderedDict[bytes, tuple[aiomysql.Pool, float]]" = OrderedDict()
+_mysql_pools_lock = asyncio.Lock()
+
+# 安装了 h2 时对外部 LLM 接口启用 HTTP/2
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 进程共享的 LLM HTTP 客户端，复用 TCP/TLS 连接
+_llm_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_llm_http_client() -> httpx.AsyncClient:
+    """获取共享的 LLM HTTP 客户端（首次调用时创建）"""
+    global _llm_http_client
+    if _llm_http_client is None or _llm_http_client.is_closed:
+        _llm_http_client = httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            timeout=60,
+            limits=httpx.Limits(
+                max_keepalive_connections=50,
+                max_connections=100,
+                keepalive_expiry=30
+            )
+        )
+    return _llm_http_client
+
+
+async def close_llm_http_client() -> None:
+    """关闭共享的 LLM HTTP 客户端（应用关闭时调用）"""
+    global _llm_http_client
+    if _llm_http_client is not None:
+        await _llm_http_client.aclose()
+        _llm_http_client = None
+
+
+async def test_tcp_connection(host: str, port: int, timeout: float = 5) -> tuple[bool, str]:
     """
-    测试 TCP 连接
+    测试 TCP 连接（异步，不阻塞事件循环）
     返回: (是否成功, 消息/错误信息)
     """
     try:
-        # 简单的 TCP 连接测试
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((host, port))
-        sock.close()
-
-        if result == 0:
-            return True, "Success"
-        else:
-            return False, f"Connection failed (error code: {result})"
-    except socket.timeout:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except asyncio.TimeoutError:
         return False, "Connection timed out"
-    except Exception as e:
+    except OSError as e:
         return False, str(e)
+    except Exception as e:
+        return False, str(e) or e.__class__.__name__
+
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, "Success"
+
+
+def _mysql_pool_key(
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    database: Optional[str]
+) -> bytes:
+    """
+    计算连接池缓存键
+
+    密码也纳入缓存键，修改密码后使用新的连接池；
+    缓存键只保存摘要，避免在内存中长期保存明文密码。
+    """
+    raw = "\0".join((host, str(port), username, database or "", password))
+    return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+
+async def _close_pools(pools: list[aiomysql.Pool]) -> None:
+    for pool in pools:
+        pool.close()
+        await pool.wait_closed()
+
+
+def _evict_mysql_pools(now: float) -> list[aiomysql.Pool]:
+    """淘汰空闲超时及超出容量的连接池（需持有锁），返回待关闭的连接池"""
+    evicted = []
+    while _mysql_pools:
+        key, (pool, last_used) = next(iter(_mysql_pools.items()))
+        if len(_mysql_pools) <= MYSQL_POOL_CACHE_SIZE and now - last_used < MYSQL_POOL_IDLE_TTL:
+            break
+        del _mysql_pools[key]
+        evicted.append(pool)
+    return evicted
+
+
+async def _get_mysql_pool(
+    host: str,
+    port: int,
+    username: str,
+    password: str,
+    database: Optional[str],
+    timeout: int
+) -> aiomysql.Pool:
+    """
+    获取（必要时创建）按连接参数缓存的 MySQL 连接池
+
+    minsize=0 时建池不会建立连接，连接在 acquire 时按需建立。
+    每次查找都会淘汰空闲超时及超出容量的连接池，不依赖新建连接池时才触发淘汰。
+    """
+    key = _mysql_pool_key(host, port, username, password, database)
+    now = time.monotonic()
+    async with _mysql_pools_lock:
+        cached = _mysql_pools.get(key)
+        if cached is not None:
+            _mysql_pools[key] = (cached[0], now)
+            _mysql_pools.move_to_end(key)
+        evicted = _evict_mysql_pools(now)
+    await _close_pools(evicted)
+    if cached is not None:
+        return cached[0]
+
+    pool = await aiomysql.create_pool(
+        host=host,
+        port=port,
+        user=username,
+        password=password,
+        db=database,
+        minsize=0,
+        maxsize=MYSQL_POOL_MAXSIZE,
+        pool_recycle=MYSQL_POOL_RECYCLE,
+        connect_timeout=timeout,
+        # 字符集在握手包中协商，无需额外的 SET NAMES；
+        # 与服务端默认一致的 autocommit 省去建连后的 SET AUTOCOMMIT=0，
+        # 探测语句也不会让连接停留在事务中而在归还时被关闭
+        charset='utf8mb4',
+        autocommit=True
+    )
+    async with _mysql_pools_lock:
+        cached = _mysql_pools.get(key)
+        if cached is None:
+            _mysql_pools[key] = (pool, now)
+            evicted = _evict_mysql_pools(now)
+        else:
+            # 并发请求已先建好连接池，关闭多余的这个
+            evicted = [pool]
+            pool = cached[0]
+    await _close_pools(evicted)
+    return pool
+
+
+async def _discard_mysql_pool(pool: aiomysql.Pool) -> None:
+    """连接出错时丢弃连接池，下次测试重新建立"""
+    async with _mysql_pools_lock:
+        for key, (cached, _) in list(_mysql_pools.items()):
+            if cached is pool:
+                del _mysql_pools[key]
+    await _close_pools([pool])
+
+
+async def shutdown_pools() -> None:
+    """关闭所有缓存的 MySQL 连接池（应用关闭时调用）"""
+    async with _mysql_pools_lock:
+        pools = [pool for pool, _ in _mysql_pools.values()]
+        _mysql_pools.clear()
+    await _close_pools(pools)
 
 
 async def test_mysql_connection(
@@ -38,32 +190,33 @@ async def test_mysql_connection(
 ) -> tuple[bool, str]:
     """
     测试 MySQL 数据库连接
+    连接池只用于限制同一数据源的并发探测数：每次测试都新建连接完成认证，
+    探测后立即关闭连接，不把已认证的连接留在池中（否则用户被删除或收回权限后
+    仍会误报成功），空闲的数据源也不会占用服务端连接
     返回: (是否成功, 消息/错误信息)
     """
-    conn = None
     try:
-        # 尝试连接 MySQL 数据库
-        conn = await aiomysql.connect(
-            host=host,
-            port=port,
-            user=username,
-            password=password,
-            db=database,
-            connect_timeout=timeout,
-            charset='utf8mb4'
-        )
+        pool = await _get_mysql_pool(host, port, username, password, database, timeout)
 
-        # 如果连接成功，尝试执行一个简单查询验证连接可用性
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT 1")
-            result = await cursor.fetchone()
-            if result and result[0] == 1:
-                db_info = f"{host}:{port}"
-                if database:
-                    db_info += f"/{database}"
-                return True, f"成功连接到 MySQL 数据库 ({db_info})"
-            else:
-                return False, "连接成功但查询验证失败"
+        # 从连接池取连接执行一次 DO 0 验证连接可用性（不产生结果集，无需解析结果行）
+        try:
+            async with pool.acquire() as conn:
+                try:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute("DO 0")
+                except Exception:
+                    conn.close()
+                    raise
+                # 正常退出（COM_QUIT）后关闭，已关闭的连接归还时会被连接池直接丢弃
+                await conn.ensure_closed()
+        except Exception:
+            await _discard_mysql_pool(pool)
+            raise
+
+        db_info = f"{host}:{port}"
+        if database:
+            db_info += f"/{database}"
+        return True, f"成功连接到 MySQL 数据库 ({db_info})"
 
     except aiomysql.OperationalError as e:
         error_code = e.args[0] if e.args else 0
@@ -86,7 +239,3 @@ async def test_mysql_connection(
 
     except Exception as e:
         return False, f"未知错误: {str(e)}"
-
-    finally:
-        if conn:
-            conn.close()
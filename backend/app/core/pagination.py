@@ -0,0 +1,126 @@
+"""
+分页查询工具
+"""
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple, Union
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select, StatementLambdaElement
+
+from app.schemas.pagination import PageResponse
+
+Statement = Union[Select, StatementLambdaElement]
+
+
+async def paginate(
+    session: AsyncSession,
+    statement: Statement,
+    page: int,
+    size: int,
+    keyset: Optional[Tuple[Any, Any]] = None,
+    cursor: Optional[str] = None
+) -> PageResponse[Any]:
+    """
+    执行分页查询
+
+    使用 COUNT(*) OVER () 窗口函数在同一次查询中返回当前页数据与总数，
+    省去单独的 COUNT 查询；传入 lambda_stmt 构建的语句时，编译结果会被缓存复用。
+
+    keyset 为 (排序列, 主键列)：传入时按两列倒序排序（statement 不应再包含排序），
+    并在结果中返回 next_cursor。带 cursor 请求时改用游标分页
+    WHERE (排序列, 主键) < 游标值，不再扫描并丢弃前面的行，此时不返回总数。
+    排序列须为 NOT NULL，可空列需由调用方自行处理。
+    未传入 keyset 时 statement 需已包含排序条件。
+    """
+    if keyset is not None:
+        sort_column, id_column = keyset
+        statement = _extend(statement, lambda s: s.order_by(sort_column.desc(), id_column.desc()))
+        if cursor:
+            return await _paginate_after_cursor(session, statement, keyset, cursor, page, size)
+
+    skip = (page - 1) * size
+    rows = (await session.execute(_extend(
+        statement,
+        lambda s: s.add_columns(func.count().over().label("_total")).offset(skip).limit(size)
+    ))).all()
+
+    if rows:
+        total = rows[0]._total
+    elif page > 1:
+        # 页码越界时窗口函数没有行可返回，回退到 COUNT 查询
+        total = (await session.execute(_extend(
+            statement,
+            lambda s: select(func.count()).select_from(s.order_by(None).subquery())
+        ))).scalar()
+    else:
+        total = 0
+
+    items = [row[0] for row in rows]
+    next_cursor = None
+    if keyset is not None and items and skip + len(items) < total:
+        next_cursor = _encode_cursor(items[-1], keyset)
+
+    return PageResponse(
+        items=items,
+        total=total,
+        page=page,
+        size=size,
+        pages=(total + size - 1) // size,
+        next_cursor=next_cursor
+    )
+
+
+async def _paginate_after_cursor(
+    session: AsyncSession,
+    statement: Statement,
+    keyset: Tuple[Any, Any],
+    cursor: str,
+    page: int,
+    size: int
+) -> PageResponse[Any]:
+    """游标分页：多取一行用于判断是否还有下一页"""
+    sort_column, id_column = keyset
+    cursor_value, cursor_id = _decode_cursor(cursor)
+    limit = size + 1
+    rows = (await session.execute(_extend(
+        statement,
+        lambda s: s.where(
+            tuple_(sort_column, id_column) < tuple_(cursor_value, cursor_id)
+        ).limit(limit)
+    ))).scalars().all()
+
+    items = rows[:size]
+    return PageResponse(
+        items=items,
+        total=None,
+        page=page,
+        size=size,
+        pages=None,
+        next_cursor=_encode_cursor(items[-1], keyset) if len(rows) > size else None
+    )
+
+
+def _extend(statement: Statement, criteria: Callable[[Select], Select]) -> Statement:
+    """向普通语句或 lambda 语句追加条件"""
+    if isinstance(statement, StatementLambdaElement):
+        return statement + criteria
+    return criteria(statement)
+
+
+def _encode_cursor(item: Any, keyset: Tuple[Any, Any]) -> str:
+    """以 "排序列ISO时间|主键" 编码游标"""
+    sort_column, id_column = keyset
+    return f"{getattr(item, sort_column.key).isoformat()}|{getattr(item, id_column.key)}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        value, item_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(value), int(item_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
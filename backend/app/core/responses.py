@@ -0,0 +1,73 @@
+"""
+自定义响应类
+"""
+import hashlib
+from typing import Any
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+try:
+    # msgpack 为可选依赖，未安装时始终返回 JSON
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# 可用 ETag 协商缓存的读接口：浏览器缓存 30 秒，之后携带 If-None-Match 重新验证
+PRIVATE_CACHE_CONTROL = "private, max-age=30"
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应，作为应用的默认响应类"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgPackResponse(Response):
+    """使用 msgpack 编码的二进制响应"""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+def negotiate_response(request: Request, content: BaseModel) -> Any:
+    """
+    按 Accept 请求头选择响应编码
+
+    客户端接受 msgpack 且已安装 msgpack 时直接编码返回，
+    否则原样返回，由 response_model 与默认的 JSON 响应类处理。
+    """
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return MsgPackResponse(content.model_dump(mode="json"))
+    return content
+
+
+def weak_etag(*parts: Any) -> str:
+    """根据版本信息（如最大更新时间、行数）生成弱 ETag"""
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag（按弱比较）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag.removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified_response(etag: str) -> Response:
+    """304 响应，不携带响应体"""
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL}
+    )
@@ -28,9 +28,13 @@ async def check_datasources():
             result = await session.execute(statement)
             datasources = result.scalars().all()
             
-            for ds in datasources:
-                logger.info(f"Checking datasource {ds.name} ({ds.host}:{ds.port})...")
-                success, message = test_tcp_connection(ds.host, ds.port)
+            # 并发探测所有数据源，单个不可达的主机不会拖慢其他探测
+            results = await asyncio.gather(
+                *(test_tcp_connection(ds.host, ds.port) for ds in datasources)
+            )
+            
+            for ds, (success, message) in zip(datasources, results):
+                logger.info(f"Checked datasource {ds.name} ({ds.host}:{ds.port}): {message}")
                 
                 ds.last_test_at = datetime.utcnow()
                 if success:
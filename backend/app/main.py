@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.db import init_db
 from app.core.config import settings
+from app.core.responses import ORJSONResponse
 from app.api.v1.api import api_router
 from app.middleware.error_handler import ErrorHandlerMiddleware, RequestLoggingMiddleware, SecurityMiddleware
 
@@ -25,9 +26,14 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         pass
 
+    from app.core.network import close_llm_http_client, shutdown_pools
+    await close_llm_http_client()
+    await shutdown_pools()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -38,6 +44,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 允许前端读取分页游标
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 添加自定义中间件
@@ -16,6 +16,7 @@ from .api_test_case import ApiTestCase, ApiTestStep, ApiTestExecution, ApiTestSt
 from .ai_config import AIProviderConfig
 from .requirement import Requirement
 from .ai_conversation import AIConversation
+from .ai_generation_task import AIGenerationTask
 from .functional_test_point import TestPoint
 from .functional_test_case import FunctionalTestCase
 from .test_case_knowledge import TestCaseKnowledge
@@ -53,6 +54,7 @@ __all__ = [
     "AIProviderConfig",
     "Requirement",
     "AIConversation",
+    "AIGenerationTask",
     "TestPoint",
     "FunctionalTestCase",
     "TestCaseKnowledge",
@@ -2,6 +2,7 @@
 AI配置模型 - 功能测试模块
 支持多AI厂商配置管理
 """
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Column
 from typing import Optional
 from datetime import datetime
@@ -10,6 +11,13 @@ from datetime import datetime
 class AIProviderConfig(SQLModel, table=True):
     """AI厂商配置表"""
     __tablename__ = "ai_provider_configs"
+    __table_args__ = (
+        # 按用户查启用/默认配置、按厂商类型查LLM（见迁移 f2c6a8d4b913）
+        Index(
+            "ix_ai_provider_configs_user_enabled_default",
+            "user_id", "is_enabled", text("is_default DESC"), "provider_type",
+        ),
+    )
 
     id: int = Field(primary_key=True)
     provider_name: str = Field(index=True)  # OpenAI/Anthropic/通义千问/文心一言
@@ -0,0 +1,25 @@
+"""
+AI用例生成任务模型 - 功能测试模块
+记录后台AI生成用例任务的状态与结果
+"""
+from sqlmodel import SQLModel, Field, Column, JSON
+from typing import Optional, Dict, Any
+from datetime import datetime
+
+
+class AIGenerationTask(SQLModel, table=True):
+    """AI用例生成任务表"""
+    __tablename__ = "ai_generation_tasks"
+
+    id: int = Field(primary_key=True)
+    requirement_id: int = Field(index=True)
+    model: str  # 使用的模型名称
+
+    # 任务状态
+    status: str = Field(default="pending")  # pending/running/completed/failed
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))  # LLM返回的用例JSON
+    error_message: Optional[str] = None
+
+    # 时间戳
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    completed_at: Optional[datetime] = None
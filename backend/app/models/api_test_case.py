@@ -6,13 +6,28 @@ API 测试用例模型
 from typing import Optional, List, Dict
 from datetime import datetime
 from sqlmodel import SQLModel, Field, Column, JSON
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, Index, func, text
 
 
 class ApiTestCase(SQLModel, table=True):
     """API 测试用例"""
 
     __tablename__ = "apitestcase"
+    __table_args__ = (
+        # 用例列表只查询未删除的用例（见迁移 3c9d2e7a1f04）
+        Index(
+            "ix_apitestcase_project_active",
+            "project_id", text("created_at DESC"),
+            postgresql_where=text("is_deleted = false"),
+            sqlite_where=text("is_deleted = false"),
+        ),
+        Index(
+            "ix_apitestcase_project_active_enabled",
+            "project_id", text("created_at DESC"),
+            postgresql_where=text("is_deleted = false AND enabled = true"),
+            sqlite_where=text("is_deleted = false AND enabled = true"),
+        ),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     project_id: int = Field(foreign_key="project.id", index=True)
@@ -37,7 +52,11 @@ class ApiTestCase(SQLModel, table=True):
 
     # 元数据
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    # 由数据库在 UPDATE 时填充
+    updated_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), onupdate=func.now())
+    )
 
     # 软删除
     is_deleted: bool = Field(default=False)
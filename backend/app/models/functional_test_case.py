@@ -2,6 +2,7 @@
 测试用例模型 - 功能测试模块
 管理详细的测试用例（包含步骤和预期结果）
 """
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Column, JSON
 from typing import Optional, List, Dict
 from datetime import datetime
@@ -10,6 +11,18 @@ from datetime import datetime
 class FunctionalTestCase(SQLModel, table=True):
     """测试用例表 (功能测试模块)"""
     __tablename__ = "test_cases"
+    __table_args__ = (
+        # 用例列表按需求、优先级过滤并按创建时间倒序分页（见迁移 d4a81f6c2e90）
+        Index(
+            "ix_test_cases_requirement_priority_created",
+            "requirement_id", "priority", text("created_at DESC"),
+        ),
+        # 需求下的用例按 (优先级, id) 游标分页（见迁移 e7b3f19a5c21）
+        Index(
+            "ix_test_cases_requirement_priority_id",
+            "requirement_id", "priority", "id",
+        ),
+    )
 
     id: int = Field(primary_key=True)
     case_id: str = Field(unique=True, index=True)  # TC-2025-001-001
@@ -1,8 +1,14 @@
 from typing import Optional, Dict
 from datetime import datetime
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Column, JSON
 
 class Project(SQLModel, table=True):
+    __table_args__ = (
+        # 项目列表按更新时间倒序分页（见迁移 d4a81f6c2e90）
+        Index("ix_project_updated_at", text("updated_at DESC")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str  # 项目名称
     key: str   # 项目标识 (如: ORDER_CENTER)
@@ -2,6 +2,7 @@
 需求模型 - 功能测试模块
 管理产品需求文档和AI澄清记录
 """
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Column, JSON
 from typing import Optional, List
 from datetime import datetime
@@ -10,6 +11,10 @@ from datetime import datetime
 class Requirement(SQLModel, table=True):
     """需求表"""
     __tablename__ = "requirements"
+    __table_args__ = (
+        # 需求列表按创建时间倒序分页（见迁移 d4a81f6c2e90）
+        Index("ix_requirements_created_at", text("created_at DESC")),
+    )
 
     id: int = Field(primary_key=True)
     requirement_id: str = Field(unique=True, index=True)  # REQ-2025-001
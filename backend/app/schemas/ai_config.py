@@ -2,7 +2,7 @@
 AI配置相关Schemas - 功能测试模块
 用于API请求/响应验证
 """
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, validator
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -60,16 +60,16 @@ class AIProviderConfigUpdate(BaseModel):
 
 class AIProviderConfigResponse(AIProviderConfigBase):
     """AI配置响应（不返回完整API Key）"""
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
-    api_key_masked: str = Field(..., description="脱敏的API Key")
+    # ORM 对象上没有该字段，由服务层校验后填入
+    api_key_masked: str = Field("****", description="脱敏的API Key")
     api_endpoint: Optional[str] = None
     user_id: int
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
-
 
 class AIProviderConfigTest(BaseModel):
     """测试AI配置"""
@@ -50,10 +50,27 @@ class ApiTestCaseResponse(BaseModel):
         from_attributes = True
 
 
+class ApiTestCaseSummary(BaseModel):
+    """API 测试用例摘要（列表项，不含 YAML 与结构化配置）"""
+    id: int
+    project_id: int
+    name: str
+    description: Optional[str]
+    environment_id: Optional[int]
+    tags: List[str]
+    enabled: bool
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
 class ApiTestCaseListResponse(BaseModel):
     """API 测试用例列表响应"""
-    total: int
-    items: List[ApiTestCaseResponse]
+    total: Optional[int] = None  # 请求 with_count=false 且无缓存时为空
+    has_more: bool = False
+    items: List[ApiTestCaseSummary]
 
 
 # ============================================================================
@@ -1,11 +1,14 @@
-from typing import Generic, TypeVar, List
+from typing import Generic, TypeVar, List, Optional
 from pydantic import BaseModel
 
 T = TypeVar("T")
 
 class PageResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
+    # 游标分页（请求带 cursor）时不统计总数，total/pages 为 None
+    total: Optional[int]
     page: int
     size: int
-    pages: int
+    pages: Optional[int]
+    # 下一页游标，没有更多数据时为 None
+    next_cursor: Optional[str] = None
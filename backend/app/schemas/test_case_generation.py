@@ -1,7 +1,7 @@
 """
 测试用例生成相关Schemas - 功能测试模块
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -52,6 +52,12 @@ class GeneratedTestCase(BaseModel):
     estimated_time: int = Field(description="预估执行时间(分钟)")
     complexity: Optional[str] = None
 
+    @field_validator('preconditions', 'tags', mode='before')
+    @classmethod
+    def none_as_empty(cls, v):
+        # 数据库中的 JSON 列可能为 NULL
+        return [] if v is None else v
+
 
 class GeneratedTestCases(BaseModel):
     """生成的测试用例集合"""
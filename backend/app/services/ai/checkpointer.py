@@ -2,15 +2,20 @@
 Checkpointer配置 - LangGraph状态持久化
 支持Memory和PostgreSQL两种存储方式
 """
+import logging
+import threading
 from typing import Optional
 from langgraph.checkpoint.memory import MemorySaver
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class CheckpointConfig:
     """Checkpointer配置类"""
 
     _instance: Optional[MemorySaver] = None
+    _lock = threading.Lock()
 
     @classmethod
     def get_checkpointer(cls):
@@ -25,9 +30,12 @@ class CheckpointConfig:
             Checkpointer实例
         """
         if cls._instance is None:
-            # 开发环境使用内存存储
-            cls._instance = MemorySaver()
-            print("⚠️  使用内存checkpointer (MemorySaver) - 服务重启后状态会丢失")
+            # 双重检查加锁，保证并发首次访问时只创建一个实例
+            with cls._lock:
+                if cls._instance is None:
+                    # 开发环境使用内存存储
+                    cls._instance = MemorySaver()
+                    logger.warning("使用内存checkpointer (MemorySaver) - 服务重启后状态会丢失")
 
         return cls._instance
 
@@ -39,7 +47,7 @@ class CheckpointConfig:
         Returns:
             Checkpointer实例
         """
-        return cls.get_checkpointer()
+        return cls._instance or cls.get_checkpointer()
 
 
 # PostgreSQL支持说明
@@ -2,12 +2,36 @@
 需求澄清LangGraph状态图 - 功能测试模块
 使用LangGraph实现多轮需求澄清对话
 """
-from typing import TypedDict, Annotated, Sequence, List, Dict, Any, Optional
+import io
+import operator
+import re
+import string
+from typing import TypedDict, Annotated, Sequence, List, Dict, Any, Optional, Tuple
+
+import orjson
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.ai.llm_service import MultiVendorLLMService
+from app.services.ai.llm_service import MultiVendorLLMService, astream_llm
+
+
+# Prompt 中展示的最近对话条数
+CHAT_HISTORY_WINDOW = 5
+
+_ROLE_LABELS = {"user": "用户"}
+
+
+def _format_message(message: Dict[str, str]) -> str:
+    """格式化单条消息为对话历史中的一行"""
+    return f"{_ROLE_LABELS.get(message['role'], 'AI助手')}: {message['content']}"
+
+
+def _append_history_window(left: Sequence[str], right: Sequence[str]) -> Tuple[str, ...]:
+    """对话历史窗口的 reducer：追加新行，只保留最近 CHAT_HISTORY_WINDOW 条"""
+    return (tuple(left) + tuple(right))[-CHAT_HISTORY_WINDOW:]
 
 
 # 定义状态
@@ -21,8 +45,10 @@ class RequirementClarificationState(TypedDict):
     requirement_name: str  # 需求名称
     module_name: str  # 模块名称
 
-    # 对话历史
-    messages: Sequence[Dict[str, str]]  # [{"role": "user/assistant", "content": "..."}]
+    # 对话历史（节点只返回新增消息，由 operator.add 追加合并）
+    messages: Annotated[Sequence[Dict[str, str]], operator.add]  # [{"role": "user/assistant", "content": "..."}]
+    # 最近对话的已格式化文本，随消息增量维护，避免每轮重新格式化
+    history_window: Annotated[Tuple[str, ...], _append_history_window]
 
     # AI分析结果
     identified_issues: List[str]  # 识别到的问题
@@ -38,14 +64,19 @@ class RequirementClarificationState(TypedDict):
     user_response: str  # 用户对问题的回复
 
 
-# Prompt模板
-ANALYZE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家，负责帮助用户将碎片化的需求转化为完整的需求文档。
+# 不支持JSON模式的厂商可能仍返回代码块或夹带说明文字，用于回退提取
+_JSON_BLOCK_RE = re.compile(r'```json\s*\n(.*?)\n```', re.DOTALL)
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+# Prompt模板（string.Template 在模块加载时解析一次）
+ANALYZE_REQUIREMENT_PROMPT = string.Template("""你是一位资深的产品经理和测试专家，负责帮助用户将碎片化的需求转化为完整的需求文档。
 
 ## 用户当前需求
-{user_input}
+$user_input
 
 ## 对话历史
-{chat_history}
+$chat_history
 
 ## 你的任务
 1. 分析用户提供的需求描述和截图，识别不完整之处
@@ -58,9 +89,8 @@ ANALYZE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家
 4. 用专业但易懂的语言，避免过于技术化
 
 ## 回答格式（JSON）:
-请严格按照以下JSON格式回答：
-```json
-{{
+请严格按照以下JSON格式回答，只输出JSON对象本身，不要使用Markdown代码块：
+{
   "requirement_document": "根据当前信息整理的需求文档（Markdown格式）",
   "questions": [
     "问题1",
@@ -77,24 +107,23 @@ ANALYZE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家
   ],
   "needs_clarification": true,
   "is_complete": false
-}}
-```
+}
 
 如果需求已经足够完整，可以将is_complete设为true，此时questions可以为空数组。
 
 现在，请分析用户的需求并开始提问。
-"""
+""")
 
-UPDATE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家，负责根据用户的回复更新需求文档。
+UPDATE_REQUIREMENT_PROMPT = string.Template("""你是一位资深的产品经理和测试专家，负责根据用户的回复更新需求文档。
 
 ## 当前需求文档
-{requirement_document}
+$requirement_document
 
 ## 用户最新回复
-{user_response}
+$user_response
 
 ## 对话历史
-{chat_history}
+$chat_history
 
 ## 你的任务
 1. 根据用户的回复更新需求文档
@@ -103,8 +132,8 @@ UPDATE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家
 4. 判断需求是否已经完整
 
 ## 回答格式（JSON）:
-```json
-{{
+只输出JSON对象本身，不要使用Markdown代码块：
+{
   "requirement_document": "更新后的需求文档（Markdown格式）",
   "questions": [
     "新问题1",
@@ -119,24 +148,26 @@ UPDATE_REQUIREMENT_PROMPT = """你是一位资深的产品经理和测试专家
   ],
   "needs_clarification": true,
   "is_complete": false
-}}
-```
+}
 
 如果需求已经完整，将is_complete设为true，questions可以为空数组。
 
 现在，请根据用户的回复更新需求文档。
-"""
+""")
 
 
 class RequirementClarificationGraph:
     """需求澄清状态图"""
 
-    def __init__(self, session: AsyncSession, user_id: int):
+    # 最多提问轮数
+    MAX_QUESTIONS = 5
+
+    def __init__(self, session: Optional[AsyncSession], user_id: int):
         """
         初始化需求澄清图
 
         Args:
-            session: 数据库会话
+            session: 默认数据库会话；图实例被缓存复用时为None，由每次调用通过 astream_chat 传入
             user_id: 用户ID
         """
         self.session = session
@@ -145,6 +176,26 @@ class RequirementClarificationGraph:
         self.graph = None
         self._build_graph()
 
+    def _get_session(self, config: Optional[RunnableConfig]) -> AsyncSession:
+        """获取本次运行所用的会话（优先使用运行配置中固定的会话）"""
+        if config:
+            session = config.get("configurable", {}).get("session")
+            if session is not None:
+                return session
+        return self.session
+
+    async def _get_llm(self, config: Optional[RunnableConfig]) -> Any:
+        """
+        获取用户默认LLM
+
+        不在图实例上另行缓存：get_default_llm 自带按配置版本和 TTL 失效的进程级缓存，
+        多进程部署下其他 worker 修改配置后最多 LLM_RESOLVE_CACHE_TTL 秒即可生效。
+        """
+        llm = await MultiVendorLLMService.get_default_llm(self._get_session(config), self.user_id)
+        if not llm:
+            raise ValueError("用户未配置AI服务，请先在AI配置中添加")
+        return llm
+
     def _build_graph(self):
         """构建状态图"""
         # 创建状态图
@@ -184,7 +235,8 @@ class RequirementClarificationGraph:
 
     async def analyze_requirement_node(
         self,
-        state: RequirementClarificationState
+        state: RequirementClarificationState,
+        config: Optional[RunnableConfig] = None
     ) -> Dict[str, Any]:
         """
         分析需求节点
@@ -194,27 +246,19 @@ class RequirementClarificationGraph:
         print("🔍 [analyze_requirement] 分析用户需求...")
 
         # 获取用户的默认LLM
-        llm = await MultiVendorLLMService.get_default_llm(self.session, self.user_id)
-        if not llm:
-            raise ValueError("用户未配置AI服务，请先在AI配置中添加")
+        llm = await self._get_llm(config)
 
         # 构建prompt
-        chat_history = self._format_chat_history(state.get("messages", []))
+        chat_history = self._format_chat_history(state.get("history_window", ()))
 
-        prompt = ANALYZE_REQUIREMENT_PROMPT.format(
+        prompt = ANALYZE_REQUIREMENT_PROMPT.substitute(
             user_input=state["user_input"],
             chat_history=chat_history
         )
 
-        # 调用LLM
-        response = await llm.ainvoke([
-            {"role": "user", "content": prompt}
-        ])
-
-        # 解析JSON响应
-        import json
+        # 调用LLM并解析JSON响应
         try:
-            result = self._extract_json(response)
+            result = await self._ainvoke_json(llm, prompt, config)
 
             return {
                 "requirement_document": result.get("requirement_document", ""),
@@ -239,7 +283,8 @@ class RequirementClarificationGraph:
 
     async def update_requirement_node(
         self,
-        state: RequirementClarificationState
+        state: RequirementClarificationState,
+        config: Optional[RunnableConfig] = None
     ) -> Dict[str, Any]:
         """
         更新需求节点
@@ -249,26 +294,20 @@ class RequirementClarificationGraph:
         print("📝 [update_requirement] 更新需求文档...")
 
         # 获取LLM
-        llm = await MultiVendorLLMService.get_default_llm(self.session, self.user_id)
+        llm = await self._get_llm(config)
 
         # 构建prompt
-        chat_history = self._format_chat_history(state.get("messages", []))
+        chat_history = self._format_chat_history(state.get("history_window", ()))
 
-        prompt = UPDATE_REQUIREMENT_PROMPT.format(
+        prompt = UPDATE_REQUIREMENT_PROMPT.substitute(
             requirement_document=state.get("requirement_document", ""),
             user_response=state.get("user_response", ""),
             chat_history=chat_history
         )
 
-        # 调用LLM
-        response = await llm.ainvoke([
-            {"role": "user", "content": prompt}
-        ])
-
-        # 解析JSON响应
-        import json
+        # 调用LLM并解析JSON响应
         try:
-            result = self._extract_json(response)
+            result = await self._ainvoke_json(llm, prompt, config)
 
             return {
                 "requirement_document": result.get("requirement_document", state.get("requirement_document", "")),
@@ -333,15 +372,14 @@ class RequirementClarificationGraph:
 
 请回答以上问题，以便完善需求文档。"""
 
-        # 添加到消息历史
-        messages = list(state.get("messages", []))
-        messages.append({
+        # 只返回新增消息，由状态的 reducer 追加到消息历史
+        message = {
             "role": "assistant",
             "content": response_content
-        })
-
+        }
         return {
-            "messages": messages,
+            "messages": [message],
+            "history_window": (_format_message(message),),
         }
 
     def should_continue_clarification(self, state: Dict[str, Any]) -> str:
@@ -351,63 +389,84 @@ class RequirementClarificationGraph:
         Returns:
             "continue" 或 "complete"
         """
-        is_complete = state.get("is_complete", False)
-        needs_clarification = state.get("needs_clarification", True)
-        question_count = state.get("question_count", 0)
-
-        # 最多提问5轮
-        max_questions = 5
-
-        if is_complete or not needs_clarification or question_count >= max_questions:
+        # 已完成、无需继续澄清或达到提问轮数上限时结束
+        if (
+            state.get("is_complete", False)
+            or not state.get("needs_clarification", True)
+            or state.get("question_count", 0) >= self.MAX_QUESTIONS
+        ):
             return "complete"
-        else:
-            return "continue"
-
-    def _format_chat_history(self, messages: List[Dict[str, str]]) -> str:
-        """格式化聊天历史"""
-        if not messages:
-            return "（无历史对话）"
+        return "continue"
 
-        formatted = []
-        for msg in messages[-5:]:  # 只显示最近5条
-            role = "用户" if msg["role"] == "user" else "AI助手"
-            formatted.append(f"{role}: {msg['content']}")
-
-        return "\n".join(formatted)
+    def _format_chat_history(self, history_window: Sequence[str]) -> str:
+        """格式化聊天历史（窗口内的行已在追加消息时格式化）"""
+        return "\n".join(history_window) or "（无历史对话）"
 
     def _format_list(self, items: List[str]) -> str:
         """格式化列表"""
         if not items:
             return "（无）"
 
-        return "\n".join([f"- {item}" for item in items])
-
-    def _extract_json(self, response: str) -> Dict[str, Any]:
-        """从LLM响应中提取JSON"""
-        import json
-        import re
+        return "- " + "\n- ".join(items)
 
-        # 尝试直接解析
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            pass
+    async def _ainvoke_json(
+        self,
+        llm: Any,
+        prompt: str,
+        config: Optional[RunnableConfig] = None
+    ) -> Dict[str, Any]:
+        """
+        流式调用LLM并解析JSON结果
 
-        # 尝试提取代码块中的JSON
-        match = re.search(r'```json\n(.*?)\n```', response, re.DOTALL)
-        if match:
+        生成的文本片段写入缓冲区，流结束后再解析完整文本。
+        片段是原始JSON的一部分而非面向用户的文本，只有运行配置中 stream_tokens 为真
+        （调用方显式开启）时才通过图的 custom 流以 {"type": "token"} 推送。
+        支持JSON模式的厂商先直接解析，输出仍不合法（如被截断或带有多余文本）时
+        与其他厂商一样回退到 _extract_json 从文本中提取。
+        """
+        json_llm = MultiVendorLLMService.with_json_mode(llm)
+        stream_tokens = bool(config and config.get("configurable", {}).get("stream_tokens"))
+        writer = get_stream_writer() if stream_tokens else None
+        buffer = io.StringIO()
+        async for chunk in astream_llm(json_llm or llm, [
+            {"role": "user", "content": prompt}
+        ]):
+            token = chunk.text
+            if token:
+                buffer.write(token)
+                if writer is not None:
+                    writer({"type": "token", "content": token})
+
+        text = buffer.getvalue()
+        if json_llm is not None:
             try:
-                return json.loads(match.group(1))
-            except json.JSONDecodeError:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError:
                 pass
+        return self._extract_json(text)
 
-        # 尝试提取JSON对象
-        match = re.search(r'\{.*\}', response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError:
-                pass
+    def _extract_json(self, response: Any) -> Dict[str, Any]:
+        """
+        从LLM响应中提取JSON
+
+        Prompt 要求直接输出JSON对象，因此先整体解析，
+        失败时再尝试 ```json 代码块和最外层对象。
+        """
+        # ChatModel 返回消息对象，取其文本内容
+        text = getattr(response, "content", response)
+
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+
+        for pattern, group in ((_JSON_BLOCK_RE, 1), (_JSON_OBJ_RE, 0)):
+            match = pattern.search(text)
+            if match:
+                try:
+                    return orjson.loads(match.group(group))
+                except orjson.JSONDecodeError:
+                    pass
 
         raise ValueError("无法从响应中提取JSON")
 
@@ -415,7 +474,9 @@ class RequirementClarificationGraph:
         self,
         requirement_id: str,
         user_input: str,
-        config: Optional[Dict[str, Any]] = None
+        config: Optional[Dict[str, Any]] = None,
+        session: Optional[AsyncSession] = None,
+        stream_tokens: bool = False
     ):
         """
         流式对话接口
@@ -424,13 +485,23 @@ class RequirementClarificationGraph:
             requirement_id: 需求ID（用作thread_id）
             user_input: 用户输入
             config: 配置参数
+            session: 本次调用使用的数据库会话，未传入时使用构造时的会话
+            stream_tokens: 是否推送LLM生成中的原始文本片段（默认关闭）
 
         Yields:
-            响应片段
+            响应片段：{"type": "message"} 为整理后的完整回复；
+            开启 stream_tokens 时另有 {"type": "token"} 为LLM生成中的原始文本片段
         """
         if config is None:
             config = {"configurable": {"thread_id": requirement_id}}
 
+        # 会话只随本次运行配置传递给各节点，图实例本身不持有请求级状态，可被并发调用共享
+        configurable = {"session": self.session, **config.get("configurable", {})}
+        if session is not None:
+            configurable["session"] = session
+        configurable["stream_tokens"] = stream_tokens
+        config = {**config, "configurable": configurable}
+
         # 初始状态
         initial_state = {
             "user_input": user_input,
@@ -438,6 +509,7 @@ class RequirementClarificationGraph:
             "requirement_name": "",
             "module_name": "",
             "messages": [],
+            "history_window": (),
             "identified_issues": [],
             "risk_points": [],
             "suggestions": [],
@@ -447,8 +519,14 @@ class RequirementClarificationGraph:
             "user_response": "",
         }
 
-        # 运行状态图
-        async for event in self.graph.astream(initial_state, config):
+        # 运行状态图：custom 流为LLM生成中的文本片段，updates 流为各节点的输出
+        async for mode, event in self.graph.astream(
+            initial_state, config, stream_mode=["custom", "updates"]
+        ):
+            if mode == "custom":
+                yield event
+                continue
+
             node_name = list(event.keys())[0]
             node_output = event[node_name]
 
@@ -2,17 +2,251 @@
 多厂商LLM服务 - 功能测试模块
 支持OpenAI、Anthropic、通义千问、文心一言
 """
-from typing import Optional, Dict, Any, List
+import asyncio
+import contextvars
+import io
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Tuple
+from langchain_core.caches import BaseCache, InMemoryCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_community.chat_models import QianfanChatEndpoint
+from langchain_community.chat_models.tongyi import ChatTongyi
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 
+from app.core.config import settings
 from app.models.ai_config import AIProviderConfig
 from app.services.ai_config_service import AIConfigService
 
 
+logger = logging.getLogger(__name__)
+
+# 进程内最多缓存的LLM实例数
+LLM_INSTANCE_CACHE_SIZE = 256
+
+
+def _build_llm_cache(backend: str) -> Optional[BaseCache]:
+    """按配置创建 LLM 响应缓存，未知或不可用的后端回退到内存缓存"""
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        from langchain_community.cache import SQLiteCache
+        return SQLiteCache(database_path=settings.LLM_CACHE_SQLITE_PATH)
+    if backend == "redis":
+        try:
+            import redis
+            from langchain_community.cache import RedisCache
+            return RedisCache(redis.Redis.from_url(settings.REDIS_URL))
+        except ImportError:
+            logger.warning("未安装 redis，LLM 响应缓存回退到内存缓存")
+    elif backend != "memory":
+        logger.warning(f"未知的 LLM 缓存后端 {backend}，回退到内存缓存")
+    return InMemoryCache(maxsize=settings.LLM_CACHE_SIZE)
+
+
+# 全局 LLM 响应缓存：相同模型参数与 prompt 的非流式调用直接返回缓存结果
+_llm_cache_configured = False
+
+
+def _configure_llm_cache() -> None:
+    """模块加载时配置一次全局 LLM 缓存"""
+    global _llm_cache_configured
+    if _llm_cache_configured:
+        return
+    cache = _build_llm_cache(settings.LLM_CACHE_BACKEND.lower())
+    if cache is not None:
+        set_llm_cache(cache)
+    _llm_cache_configured = True
+
+
+_configure_llm_cache()
+
+
+# 厂商类型 -> LLM构建函数，参数为 (模型名称, API Key, 自定义endpoint, 通用参数)
+_LLM_BUILDERS: Dict[str, Callable[[str, str, Optional[str], Dict[str, Any]], Any]] = {
+    "openai": lambda model_name, api_key, api_endpoint, kwargs: ChatOpenAI(
+        model=model_name,
+        openai_api_key=api_key,
+        base_url=api_endpoint,
+        **kwargs
+    ),
+    "anthropic": lambda model_name, api_key, api_endpoint, kwargs: ChatAnthropic(
+        model=model_name,
+        anthropic_api_key=api_key,
+        base_url=api_endpoint,
+        **kwargs
+    ),
+    # 阿里云通义千问
+    "qwen": lambda model_name, api_key, api_endpoint, kwargs: ChatTongyi(
+        dashscope_api_key=api_key,
+        model_name=model_name,
+        **kwargs
+    ),
+    # 百度文心一言
+    "qianfan": lambda model_name, api_key, api_endpoint, kwargs: QianfanChatEndpoint(
+        qianfan_api_key=api_key,
+        model=model_name,
+        **kwargs
+    ),
+}
+
+
+@lru_cache(maxsize=LLM_INSTANCE_CACHE_SIZE)
+def _build_llm(
+    provider_type: str,
+    model_name: str,
+    api_key: str,
+    api_endpoint: Optional[str],
+    temperature: float,
+    max_tokens: int
+) -> Any:
+    """
+    构建LLM实例（按全部构建参数缓存）
+
+    以参数值而非配置ID作为缓存键：配置被修改后参数不同，自然构建新实例。
+    """
+    builder = _LLM_BUILDERS.get(provider_type)
+    if builder is None:
+        raise ValueError(f"不支持的AI厂商: {provider_type}")
+
+    # 构建通用参数
+    kwargs = {
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    return builder(model_name, api_key, api_endpoint, kwargs)
+
+
+# 用户LLM解析结果缓存：(用户ID, 厂商类型或 "default") -> (配置版本号, 过期时间, LLM实例)
+# 配置增删改会递增版本号使缓存失效；TTL 兜底其他进程中的修改
+LLM_RESOLVE_CACHE_SIZE = 10_000
+LLM_RESOLVE_CACHE_TTL = 60
+_resolved_llms: Dict[Tuple[int, str], Tuple[int, float, Any]] = {}
+
+
+def _get_resolved_llm(user_id: int, key: str) -> Optional[Any]:
+    """读取缓存的LLM实例，版本号变化或已过期时视为未命中"""
+    entry = _resolved_llms.get((user_id, key))
+    if entry is None:
+        return None
+    version, expires_at, llm = entry
+    if version != AIConfigService.config_version(user_id) or expires_at <= time.monotonic():
+        _resolved_llms.pop((user_id, key), None)
+        return None
+    return llm
+
+
+def _store_resolved_llm(user_id: int, key: str, version: int, llm: Any) -> None:
+    """缓存LLM实例，超出容量时淘汰最早写入的条目"""
+    if len(_resolved_llms) >= LLM_RESOLVE_CACHE_SIZE:
+        _resolved_llms.pop(next(iter(_resolved_llms)), None)
+    _resolved_llms[(user_id, key)] = (version, time.monotonic() + LLM_RESOLVE_CACHE_TTL, llm)
+
+
+def evict_user_llms(user_id: int) -> None:
+    """
+    清除持有用户API Key的LLM缓存（配置修改或删除后调用）
+
+    删除该用户已解析的LLM实例；_build_llm 以明文密钥为缓存键，无法按用户定位，整体清空。
+    """
+    for cache_key in [k for k in _resolved_llms if k[0] == user_id]:
+        _resolved_llms.pop(cache_key, None)
+    _build_llm.cache_clear()
+
+
+# 支持 response_format={"type": "json_object"} 的聊天模型
+_JSON_MODE_MODELS = (ChatOpenAI,)
+
+# 底层 SDK 只有同步流式接口的聊天模型：其 astream 每个分片都经一次 run_in_executor
+_SYNC_STREAM_MODELS = (ChatTongyi,)
+
+_STREAM_DONE = object()
+
+
+async def _astream_in_thread(llm: Any, messages: Any) -> AsyncIterator[Any]:
+    """
+    在单个生产者线程中消费同步 stream，分片经 asyncio.Queue 交回事件循环
+
+    整个流只占用一个线程池任务；消费方提前退出时通知生产者线程停止。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def produce() -> None:
+        try:
+            for chunk in llm.stream(messages):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_DONE)
+
+    # 复制上下文，保证回调/追踪等 contextvars 在生产者线程中可见
+    loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while (item := await queue.get()) is not _STREAM_DONE:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def astream_llm(llm: Any, messages: Any) -> AsyncIterator[Any]:
+    """
+    异步流式调用聊天模型
+
+    原生异步的厂商直接使用 llm.astream；仅有同步 SDK 的厂商走单生产者线程。
+    """
+    if isinstance(llm, _SYNC_STREAM_MODELS):
+        return _astream_in_thread(llm, messages)
+    return llm.astream(messages)
+
+
+# 消息角色 -> langchain 消息类型
+ROLE_MAP = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+
+
+# Anthropic 提示缓存的最小前缀约 1024 tokens，按约 4 字符/token 估算
+PROMPT_CACHE_MIN_CHARS = 4096
+
+_EPHEMERAL_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _to_lc_messages(
+    messages: List[Dict[str, str]],
+    prompt_cache: bool = False
+) -> List[Any]:
+    """
+    将 {"role", "content"} 字典列表转换为 langchain 消息（忽略未知角色）
+
+    prompt_cache 为真时，为最后一条足够长的系统消息打上 cache_control 断点，
+    使 Anthropic 缓存该前缀，后续请求复用同一系统提示时按缓存读取计费。
+    """
+    lc_messages = [ROLE_MAP[m["role"]](content=m["content"]) for m in messages if m["role"] in ROLE_MAP]
+    if prompt_cache:
+        for i in range(len(lc_messages) - 1, -1, -1):
+            message = lc_messages[i]
+            if isinstance(message, SystemMessage):
+                if len(message.content) >= PROMPT_CACHE_MIN_CHARS:
+                    lc_messages[i] = SystemMessage(content=[{
+                        "type": "text",
+                        "text": message.content,
+                        "cache_control": _EPHEMERAL_CACHE_CONTROL,
+                    }])
+                break
+    return lc_messages
+
+
 class MultiVendorLLMService:
     """多厂商LLM服务"""
 
@@ -31,53 +265,34 @@ class MultiVendorLLMService:
         """
         获取LLM实例
 
+        相同连接参数的实例在进程内复用，避免每次调用都重新构建客户端
+
         Returns:
             LLM实例（langchain聊天模型）
         """
-        provider_type = self._provider_type
+        return _build_llm(
+            self._provider_type,
+            self.config.model_name,
+            self._decrypted_api_key,
+            self.config.api_endpoint,
+            self.config.temperature,
+            self.config.max_tokens
+        )
 
-        # 构建通用参数
-        kwargs = {
-            "temperature": self.config.temperature,
-            "max_tokens": self.config.max_tokens,
-        }
+    @staticmethod
+    def with_json_mode(llm: Any) -> Optional[Any]:
+        """
+        为LLM实例开启JSON模式
 
-        # 根据厂商类型创建对应的LLM实例
-        if provider_type == "openai":
-            return ChatOpenAI(
-                model=self.config.model_name,
-                openai_api_key=self._decrypted_api_key,
-                base_url=self.config.api_endpoint,
-                **kwargs
-            )
-
-        elif provider_type == "anthropic":
-            return ChatAnthropic(
-                model=self.config.model_name,
-                anthropic_api_key=self._decrypted_api_key,
-                base_url=self.config.api_endpoint,
-                **kwargs
-            )
-
-        elif provider_type == "qwen":
-            # 阿里云通义千问
-            from langchain_community.chat_models.tongyi import ChatTongyi
-            return ChatTongyi(
-                dashscope_api_key=self._decrypted_api_key,
-                model_name=self.config.model_name,
-                **kwargs
-            )
-
-        elif provider_type == "qianfan":
-            # 百度文心一言
-            return QianfanChatEndpoint(
-                qianfan_api_key=self._decrypted_api_key,
-                model=self.config.model_name,
-                **kwargs
-            )
-
-        else:
-            raise ValueError(f"不支持的AI厂商: {provider_type}")
+        Args:
+            llm: get_llm 返回的LLM实例
+
+        Returns:
+            绑定了 response_format 的LLM；厂商不支持JSON模式时返回None
+        """
+        if isinstance(llm, _JSON_MODE_MODELS):
+            return llm.bind(response_format={"type": "json_object"})
+        return None
 
     @staticmethod
     async def get_default_llm(session: AsyncSession, user_id: int) -> Optional[Any]:
@@ -91,21 +306,30 @@ class MultiVendorLLMService:
         Returns:
             LLM实例或None（如果没有默认配置）
         """
+        llm = _get_resolved_llm(user_id, "default")
+        if llm is not None:
+            return llm
+        # 先取版本号再查库，期间配置被修改时缓存条目随即失效
+        version = AIConfigService.config_version(user_id)
+
         # 获取默认配置
         result = await session.execute(
             select(AIProviderConfig)
             .where(AIProviderConfig.user_id == user_id)
             .where(AIProviderConfig.is_default == True)
             .where(AIProviderConfig.is_enabled == True)
+            .order_by(AIProviderConfig.created_at.desc())  # 与 get_default_config 一致，取最新的
+            .limit(1)
         )
-        config = result.scalar_one_or_none()
+        config = result.scalars().first()
 
         if not config:
             return None
 
         # 创建并返回LLM实例
-        llm_service = MultiVendorLLMService(config)
-        return llm_service.get_llm()
+        llm = MultiVendorLLMService(config).get_llm()
+        _store_resolved_llm(user_id, "default", version, llm)
+        return llm
 
     @staticmethod
     async def get_llm_by_provider(
@@ -124,6 +348,11 @@ class MultiVendorLLMService:
         Returns:
             LLM实例或None
         """
+        llm = _get_resolved_llm(user_id, provider_type)
+        if llm is not None:
+            return llm
+        version = AIConfigService.config_version(user_id)
+
         # 获取指定厂商的配置
         result = await session.execute(
             select(AIProviderConfig)
@@ -131,70 +360,115 @@ class MultiVendorLLMService:
             .where(AIProviderConfig.provider_type == provider_type)
             .where(AIProviderConfig.is_enabled == True)
             .order_by(AIProviderConfig.is_default.desc())
+            .limit(1)
         )
-        config = result.scalar_one_or_none()
+        config = result.scalars().first()
 
         if not config:
             return None
 
         # 创建并返回LLM实例
-        llm_service = MultiVendorLLMService(config)
-        return llm_service.get_llm()
-
-    async def ainvoke(self, messages: List[Dict[str, str]]) -> str:
+        llm = MultiVendorLLMService(config).get_llm()
+        _store_resolved_llm(user_id, provider_type, version, llm)
+        return llm
+
+    async def ainvoke(
+        self,
+        messages: List[Dict[str, str]],
+        llm: Optional[Any] = None
+    ) -> str:
         """
         异步调用LLM
 
         Args:
             messages: 消息列表，格式为 [{"role": "user", "content": "..."}]
+            llm: 已获取的LLM实例（可选，未传入时使用 get_llm()）
 
         Returns:
             LLM响应文本
         """
-        llm = self.get_llm()
+        llm = llm or self.get_llm()
 
         # 转换消息格式（如果需要）
-        from langchain.schema import HumanMessage, AIMessage, SystemMessage
-        lc_messages = []
-        for msg in messages:
-            if msg["role"] == "system":
-                lc_messages.append(SystemMessage(content=msg["content"]))
-            elif msg["role"] == "user":
-                lc_messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                lc_messages.append(AIMessage(content=msg["content"]))
+        lc_messages = _to_lc_messages(messages, self._provider_type == "anthropic")
 
         # 调用LLM
         response = await llm.ainvoke(lc_messages)
         return response.content
 
-    async def astream(self, messages: List[Dict[str, str]]):
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        llm: Optional[Any] = None
+    ):
         """
         异步流式调用LLM
 
         Args:
             messages: 消息列表
+            llm: 已获取的LLM实例（可选，未传入时使用 get_llm()）
 
         Yields:
             LLM响应文本片段
         """
-        llm = self.get_llm()
+        llm = llm or self.get_llm()
 
         # 转换消息格式
-        from langchain.schema import HumanMessage, AIMessage, SystemMessage
-        lc_messages = []
-        for msg in messages:
-            if msg["role"] == "system":
-                lc_messages.append(SystemMessage(content=msg["content"]))
-            elif msg["role"] == "user":
-                lc_messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                lc_messages.append(AIMessage(content=msg["content"]))
+        lc_messages = _to_lc_messages(messages, self._provider_type == "anthropic")
 
         # 流式调用LLM
-        async for chunk in llm.astream(lc_messages):
+        async for chunk in astream_llm(llm, lc_messages):
             yield chunk.content
 
+    async def abatch(
+        self,
+        prompts: List[List[Dict[str, str]]],
+        max_concurrency: int = 10
+    ) -> List[str]:
+        """
+        并发调用LLM回答多组消息
+
+        使用 langchain 的 abatch 并发发送请求，最多同时 max_concurrency 个，
+        结果顺序与 prompts 一致。
+
+        Args:
+            prompts: 多组消息列表
+            max_concurrency: 最大并发请求数
+
+        Returns:
+            LLM响应文本列表
+        """
+        prompt_cache = self._provider_type == "anthropic"
+        lc_messages_list = [_to_lc_messages(messages, prompt_cache) for messages in prompts]
+        results = await self.get_llm().abatch(
+            lc_messages_list,
+            config={"max_concurrency": max_concurrency}
+        )
+        return [result.content for result in results]
+
+    async def acollect(
+        self,
+        messages: List[Dict[str, str]],
+        llm: Optional[Any] = None
+    ) -> str:
+        """
+        流式调用LLM并拼接完整响应文本
+
+        需要完整文本时优先使用本方法：片段写入同一个 StringIO 缓冲区，
+        避免调用方用 += 逐段拼接字符串。
+
+        Args:
+            messages: 消息列表
+            llm: 已获取的LLM实例（可选，未传入时使用 get_llm()）
+
+        Returns:
+            LLM响应文本
+        """
+        buffer = io.StringIO()
+        async for chunk in self.astream(messages, llm):
+            buffer.write(chunk)
+        return buffer.getvalue()
+
     def get_model_info(self) -> Dict[str, Any]:
         """
         获取当前模型信息
@@ -2,7 +2,11 @@
 AI配置服务 - 功能测试模块
 处理AI厂商配置的业务逻辑
 """
-from typing import List, Optional
+import asyncio
+from dataclasses import dataclass
+from functools import cache, lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 from cryptography.fernet import Fernet
@@ -10,6 +14,13 @@ import base64
 import os
 import httpx
 
+try:
+    # rfernet 为可选依赖（Rust 实现的 Fernet，密文与 cryptography 互通），未安装时使用 cryptography
+    import rfernet
+except ImportError:  # pragma: no cover
+    rfernet = None
+
+from app.core.network import get_llm_http_client
 from app.models.ai_config import AIProviderConfig
 from app.schemas.ai_config import (
     AIProviderConfigCreate,
@@ -20,29 +31,112 @@ from app.schemas.ai_config import (
 )
 
 
+# 解密结果缓存条数
+DECRYPT_CACHE_SIZE = 4096
+
+# 测试API连接的请求超时（秒）
+API_TEST_TIMEOUT = 10.0
+
+
+def _bearer_auth(api_key: str) -> Dict[str, str]:
+    """Bearer Token 鉴权请求头"""
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+@dataclass(frozen=True)
+class ApiTestSpec:
+    """API连接测试的厂商参数"""
+    label: str  # 提示信息中的名称
+    endpoint: str  # 默认端点
+    auth: Callable[[str], Dict[str, str]]  # 由API Key生成鉴权请求头
+    prompt: str = "你好"
+    unauthorized_hint: str = "请检查API Key"
+    check_choices: bool = False  # 校验响应中的 choices 并回显模型回复
+
+
+# 厂商类型 -> API连接测试参数
+API_TEST_SPECS: Dict[str, ApiTestSpec] = {
+    "glm": ApiTestSpec(
+        label="智谱AI API",
+        endpoint="https://open.bigmodel.cn/api/paas/v4/chat/completions",
+        auth=_bearer_auth,
+        unauthorized_hint="请检查API Key是否正确",
+        check_choices=True,
+    ),
+    "openai": ApiTestSpec(
+        label="OpenAI API",
+        endpoint="https://api.openai.com/v1/chat/completions",
+        auth=_bearer_auth,
+        prompt="Hello",
+    ),
+    "anthropic": ApiTestSpec(
+        label="Anthropic API",
+        endpoint="https://api.anthropic.com/v1/messages",
+        auth=lambda api_key: {"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+        prompt="Hello",
+    ),
+    "qwen": ApiTestSpec(
+        label="通义千问API",
+        endpoint="https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions",
+        auth=_bearer_auth,
+    ),
+    # 文心一言需要从API Key中提取 Access Key 和 Secret Key，简化测试：只检查端点是否可达
+    "qianfan": ApiTestSpec(
+        label="文心一言API",
+        endpoint="https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions",
+        auth=lambda api_key: {},
+        unauthorized_hint="请检查API Key格式",
+    ),
+}
+
+
+class _RustFernet:
+    """rfernet 适配为 cryptography Fernet 的 bytes 接口（rfernet 的密文为 str）"""
+
+    def __init__(self, key: bytes):
+        self._fernet = rfernet.Fernet(key.decode())
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._fernet.encrypt(data).encode()
+
+    def decrypt(self, token: bytes) -> bytes:
+        return self._fernet.decrypt(token.decode())
+
+
 class EncryptionService:
     """加密服务"""
 
-    # 从环境变量获取密钥，如果不存在则生成一个
-    _key = os.getenv("ENCRYPTION_KEY")
-    if not _key:
-        # 生成一个32字节的密钥（生产环境应该从环境变量读取）
-        _key = base64.urlsafe_b64encode(b"Sisyphus-X-2025-Enc-Key!!").decode()
+    @staticmethod
+    @cache
+    def _get_cipher() -> Union[Fernet, _RustFernet]:
+        """
+        获取Fernet加密器（首次使用时构建，进程内只构建一次）
+
+        优先使用环境变量 ENCRYPTION_KEY，未设置时使用默认密钥；
+        密钥无效时生成一个新密钥。
+        已安装 rfernet 时默认使用 Rust 实现，ENCRYPTION_BACKEND=py 可强制使用 cryptography。
+        """
+        use_rust = rfernet is not None and os.getenv("ENCRYPTION_BACKEND", "rust") == "rust"
+        cipher_cls = _RustFernet if use_rust else Fernet
 
-    # 确保密钥是有效的Fernet密钥
-    try:
-        _cipher = Fernet(_key.encode() if isinstance(_key, str) else _key)
-    except Exception:
-        # 如果环境变量的密钥无效，生成一个新密钥
-        _key = Fernet.generate_key().decode()
-        _cipher = Fernet(_key)
+        key = os.getenv("ENCRYPTION_KEY")
+        if not key:
+            # 生成一个32字节的密钥（生产环境应该从环境变量读取）
+            key = base64.urlsafe_b64encode(b"Sisyphus-X-2025-Enc-Key!!").decode()
+
+        # 确保密钥是有效的Fernet密钥
+        try:
+            return cipher_cls(key.encode())
+        except Exception:
+            # 如果环境变量的密钥无效，生成一个新密钥
+            return cipher_cls(Fernet.generate_key())
 
     @classmethod
     def encrypt_api_key(cls, api_key: str) -> str:
         """加密API Key"""
         if not api_key:
             return ""
-        encrypted = cls._cipher.encrypt(api_key.encode())
+        encrypted = cls._get_cipher().encrypt(api_key.encode())
         return encrypted.decode()
 
     @classmethod
@@ -51,11 +145,46 @@ class EncryptionService:
         if not encrypted_key:
             return ""
         try:
-            decrypted = cls._cipher.decrypt(encrypted_key.encode())
-            return decrypted.decode()
+            return cls._decrypt(encrypted_key)
         except Exception as e:
             raise ValueError(f"解密失败: {str(e)}")
 
+    @classmethod
+    def decrypt_many(cls, encrypted_keys: Sequence[str]) -> Tuple[List[str], List[bool]]:
+        """
+        批量解密API Key
+
+        Returns:
+            (解密结果列表, 是否解密成功的标记列表)，解密失败的位置结果为空字符串
+        """
+        decrypted = [cls._try_decrypt(key) if key else "" for key in encrypted_keys]
+        ok_mask = [key is not None for key in decrypted]
+        return [key or "" for key in decrypted], ok_mask
+
+    @classmethod
+    def _try_decrypt(cls, encrypted_key: str) -> Optional[str]:
+        """解密，失败时返回None"""
+        try:
+            return cls._decrypt(encrypted_key)
+        except Exception:
+            return None
+
+    @staticmethod
+    @lru_cache(maxsize=DECRYPT_CACHE_SIZE)
+    def _decrypt(encrypted_key: str) -> str:
+        """
+        解密并缓存结果
+
+        Fernet 密文不可变（每次加密都会生成新密文），以密文为键缓存是安全的；
+        解密失败抛出的异常不会被缓存。
+        """
+        return EncryptionService._get_cipher().decrypt(encrypted_key.encode()).decode()
+
+    @classmethod
+    def clear_decrypt_cache(cls) -> None:
+        """清空解密缓存（配置修改或删除后调用，不在内存中保留旧密钥）"""
+        cls._decrypt.cache_clear()
+
     @classmethod
     def mask_api_key(cls, api_key: str) -> str:
         """脱敏API Key，只显示前4位和后4位"""
@@ -64,53 +193,100 @@ class EncryptionService:
         return f"{api_key[:4]}...{api_key[-4:]}"
 
 
+# 构建响应所需的列（外加密文），列表/默认配置查询只投影这些列，不构建ORM对象
+_RESPONSE_COLUMNS = (
+    AIProviderConfig.id,
+    AIProviderConfig.provider_name,
+    AIProviderConfig.provider_type,
+    AIProviderConfig.model_name,
+    AIProviderConfig.temperature,
+    AIProviderConfig.max_tokens,
+    AIProviderConfig.is_enabled,
+    AIProviderConfig.is_default,
+    AIProviderConfig.api_endpoint,
+    AIProviderConfig.user_id,
+    AIProviderConfig.created_at,
+    AIProviderConfig.updated_at,
+    AIProviderConfig.api_key_encrypted,
+)
+
+# 响应模型中直接取自配置行的字段（api_key_masked 单独计算）
+_RESPONSE_FIELD_NAMES = tuple(
+    name for name in AIProviderConfigResponse.model_fields if name != "api_key_masked"
+)
+
+
+# 每个用户AI配置的版本号，配置变更时递增，供缓存LLM实例的调用方判断是否失效
+_config_versions: Dict[int, int] = {}
+
+
 class AIConfigService:
     """AI配置服务"""
 
+    @staticmethod
+    def config_version(user_id: int) -> int:
+        """获取用户AI配置的当前版本号"""
+        return _config_versions.get(user_id, 0)
+
+    @staticmethod
+    def _bump_config_version(user_id: int) -> None:
+        """用户AI配置变更后递增版本号"""
+        _config_versions[user_id] = _config_versions.get(user_id, 0) + 1
+
+    @staticmethod
+    def _evict_key_caches(user_id: int) -> None:
+        """配置修改或删除后清除所有持有明文密钥的缓存，不在内存中保留旧密钥"""
+        # 延迟导入：llm_service 依赖本模块
+        from app.services.ai.llm_service import evict_user_llms
+
+        EncryptionService.clear_decrypt_cache()
+        evict_user_llms(user_id)
+
+    @staticmethod
+    def _to_response(config: Any, api_key: str) -> AIProviderConfigResponse:
+        """
+        由ORM对象或列投影行构建响应模型，并填入脱敏的API Key
+
+        数据来自数据库，已满足模型约束，使用 model_construct 跳过字段校验；
+        仅将厂商类型转换为枚举，保证序列化结果与校验构建时一致。
+        """
+        values = {name: getattr(config, name) for name in _RESPONSE_FIELD_NAMES}
+        values["provider_type"] = ProviderType(values["provider_type"])
+        values["api_key_masked"] = EncryptionService.mask_api_key(api_key)
+        return AIProviderConfigResponse.model_construct(**values)
+
     @staticmethod
     async def get_user_configs(
         session: AsyncSession,
-        user_id: int
+        user_id: int,
+        include_masked: bool = True
     ) -> List[AIProviderConfigResponse]:
-        """获取用户的所有AI配置"""
+        """
+        获取用户的所有AI配置
+
+        include_masked 为假时不解密API Key，脱敏字段固定为 "****"，
+        也不再过滤解密失败的配置（只需要元数据的调用方使用）
+        """
         result = await session.execute(
-            select(AIProviderConfig)
+            select(*_RESPONSE_COLUMNS)
             .where(AIProviderConfig.user_id == user_id)
             .order_by(AIProviderConfig.is_default.desc(), AIProviderConfig.created_at)
         )
-        configs = result.scalars().all()
-
-        # 转换为响应格式（脱敏API Key）
-        responses = []
-        for config in configs:
-            try:
-                # 解密并脱敏API Key
-                decrypted_key = EncryptionService.decrypt_api_key(config.api_key_encrypted)
-                masked_key = EncryptionService.mask_api_key(decrypted_key)
-
-                # 创建响应对象（兼容 Pydantic v1 和 v2）
-                response_data = {
-                    'id': config.id,
-                    'provider_name': config.provider_name,
-                    'provider_type': config.provider_type,
-                    'model_name': config.model_name,
-                    'temperature': config.temperature,
-                    'max_tokens': config.max_tokens,
-                    'is_enabled': config.is_enabled,
-                    'is_default': config.is_default,
-                    'api_key_masked': masked_key,
-                    'api_endpoint': config.api_endpoint,
-                    'user_id': config.user_id,
-                    'created_at': config.created_at,
-                    'updated_at': config.updated_at,
-                }
-                response = AIProviderConfigResponse(**response_data)
-                responses.append(response)
-            except Exception as e:
-                # 跳过解密失败的配置
-                continue
-
-        return responses
+        configs = result.all()
+
+        if not include_masked:
+            return [AIConfigService._to_response(config, "") for config in configs]
+
+        # 批量解密后一次推导构建响应（脱敏API Key，跳过解密失败的配置）
+        decrypted_keys, ok_mask = EncryptionService.decrypt_many(
+            [config.api_key_encrypted for config in configs]
+        )
+        to_response = AIConfigService._to_response
+        return [
+            to_response(config, decrypted_key)
+            for config, decrypted_key, ok in zip(configs, decrypted_keys, ok_mask)
+            if ok
+        ]
 
     @staticmethod
     async def get_default_config(
@@ -119,40 +295,21 @@ class AIConfigService:
     ) -> Optional[AIProviderConfigResponse]:
         """获取用户的默认AI配置"""
         result = await session.execute(
-            select(AIProviderConfig)
+            select(*_RESPONSE_COLUMNS)
             .where(AIProviderConfig.user_id == user_id)
             .where(AIProviderConfig.is_default == True)
             .where(AIProviderConfig.is_enabled == True)
             .order_by(AIProviderConfig.created_at.desc())  # 按创建时间降序，获取最新的
             .limit(1)  # 只获取一条记录
         )
-        config = result.scalar_one_or_none()
+        config = result.first()
 
         if not config:
             return None
 
         try:
-            # 解密并脱敏API Key
             decrypted_key = EncryptionService.decrypt_api_key(config.api_key_encrypted)
-            masked_key = EncryptionService.mask_api_key(decrypted_key)
-
-            # 创建响应对象（兼容 Pydantic v1 和 v2）
-            response_data = {
-                'id': config.id,
-                'provider_name': config.provider_name,
-                'provider_type': config.provider_type,
-                'model_name': config.model_name,
-                'temperature': config.temperature,
-                'max_tokens': config.max_tokens,
-                'is_enabled': config.is_enabled,
-                'is_default': config.is_default,
-                'api_key_masked': masked_key,
-                'api_endpoint': config.api_endpoint,
-                'user_id': config.user_id,
-                'created_at': config.created_at,
-                'updated_at': config.updated_at,
-            }
-            return AIProviderConfigResponse(**response_data)
+            return AIConfigService._to_response(config, decrypted_key)
         except Exception as e:
             # 解密或其他错误，返回 None
             return None
@@ -163,33 +320,19 @@ class AIConfigService:
         config_id: int,
         user_id: int
     ) -> Optional[AIProviderConfigResponse]:
-        """根据ID获取AI配置"""
-        config = await session.get(AIProviderConfig, config_id)
+        """根据ID获取AI配置（与列表一致只投影响应所需的列，归属校验在SQL中完成）"""
+        result = await session.execute(
+            select(*_RESPONSE_COLUMNS)
+            .where(AIProviderConfig.id == config_id)
+            .where(AIProviderConfig.user_id == user_id)
+        )
+        config = result.first()
 
-        if not config or config.user_id != user_id:
+        if not config:
             return None
 
-        # 解密并脱敏API Key
         decrypted_key = EncryptionService.decrypt_api_key(config.api_key_encrypted)
-        masked_key = EncryptionService.mask_api_key(decrypted_key)
-
-        # 创建响应对象（兼容 Pydantic v1 和 v2）
-        response_data = {
-            'id': config.id,
-            'provider_name': config.provider_name,
-            'provider_type': config.provider_type,
-            'model_name': config.model_name,
-            'temperature': config.temperature,
-            'max_tokens': config.max_tokens,
-            'is_enabled': config.is_enabled,
-            'is_default': config.is_default,
-            'api_key_masked': masked_key,
-            'api_endpoint': config.api_endpoint,
-            'user_id': config.user_id,
-            'created_at': config.created_at,
-            'updated_at': config.updated_at,
-        }
-        return AIProviderConfigResponse(**response_data)
+        return AIConfigService._to_response(config, decrypted_key)
 
     @staticmethod
     async def create_config(
@@ -219,14 +362,12 @@ class AIConfigService:
             api_endpoint=data.api_endpoint
         )
 
+        # 各列均为客户端默认值，提交后对象已完整（会话 expire_on_commit=False），无需 refresh
         session.add(config)
         await session.commit()
-        await session.refresh(config)
+        AIConfigService._bump_config_version(user_id)
 
-        return AIProviderConfigResponse(
-            **config.__dict__,
-            api_key_masked=EncryptionService.mask_api_key(data.api_key)
-        )
+        return AIConfigService._to_response(config, data.api_key)
 
     @staticmethod
     async def update_config(
@@ -261,14 +402,12 @@ class AIConfigService:
             setattr(config, field, value)
 
         await session.commit()
-        await session.refresh(config)
+        AIConfigService._bump_config_version(user_id)
+        AIConfigService._evict_key_caches(user_id)
 
-        return AIProviderConfigResponse(
-            **config.__dict__,
-            api_key_masked=EncryptionService.mask_api_key(
-                EncryptionService.decrypt_api_key(config.api_key_encrypted)
-            )
-        )
+        # 本次提交了新API Key时直接使用明文，无需再解密刚加密的密文
+        api_key = data.api_key or EncryptionService.decrypt_api_key(config.api_key_encrypted)
+        return AIConfigService._to_response(config, api_key)
 
     @staticmethod
     async def delete_config(
@@ -284,6 +423,8 @@ class AIConfigService:
 
         await session.delete(config)
         await session.commit()
+        AIConfigService._bump_config_version(user_id)
+        AIConfigService._evict_key_caches(user_id)
         return True
 
     @staticmethod
@@ -292,25 +433,47 @@ class AIConfigService:
         user_id: int,
         provider_type: str
     ):
-        """清除用户指定厂商类型的默认标记"""
-        result = await session.execute(
-            select(AIProviderConfig)
+        """
+        清除用户指定厂商类型的默认标记（单条 UPDATE，不加载行）
+
+        不单独提交，与调用方的新增/修改在同一事务中提交
+        """
+        await session.execute(
+            update(AIProviderConfig)
             .where(AIProviderConfig.user_id == user_id)
             .where(AIProviderConfig.provider_type == provider_type)
             .where(AIProviderConfig.is_default == True)
+            .values(is_default=False)
         )
-        configs = result.scalars().all()
-
-        for config in configs:
-            config.is_default = False
-
-        await session.commit()
 
     @staticmethod
     def decrypt_config_key(config: AIProviderConfig) -> str:
         """解密配置的API Key（内部使用）"""
         return EncryptionService.decrypt_api_key(config.api_key_encrypted)
 
+    @staticmethod
+    async def test_many(
+        specs: Sequence[Tuple[str, str, str, Optional[str]]]
+    ) -> List[TestResult]:
+        """
+        并发测试多组API连接
+
+        Args:
+            specs: (厂商类型, API密钥, 模型名称, 自定义API端点) 列表
+
+        Returns:
+            与 specs 顺序一致的测试结果，单个测试抛出的异常转为失败结果
+        """
+        results = await asyncio.gather(
+            *(AIConfigService.test_api_connection(*spec) for spec in specs),
+            return_exceptions=True
+        )
+        return [
+            result if isinstance(result, TestResult)
+            else TestResult(success=False, message="API测试失败", error=str(result))
+            for result in results
+        ]
+
     @staticmethod
     async def test_api_connection(
         provider_type: str,
@@ -330,242 +493,52 @@ class AIConfigService:
         Returns:
             TestResult: 测试结果
         """
-        try:
-            # 根据厂商类型构建测试请求
-            if provider_type == "glm":
-                # 智谱AI测试
-                return await AIConfigService._test_zhipu(api_key, model_name, api_endpoint)
-            elif provider_type == "openai":
-                return await AIConfigService._test_openai(api_key, model_name, api_endpoint)
-            elif provider_type == "anthropic":
-                return await AIConfigService._test_anthropic(api_key, model_name, api_endpoint)
-            elif provider_type == "qwen":
-                return await AIConfigService._test_qwen(api_key, model_name, api_endpoint)
-            elif provider_type == "qianfan":
-                return await AIConfigService._test_qianfan(api_key, model_name, api_endpoint)
-            else:
-                return TestResult(
-                    success=False,
-                    message=f"暂不支持测试厂商类型: {provider_type}",
-                    error="不支持的厂商类型"
-                )
-        except Exception as e:
+        spec = API_TEST_SPECS.get(provider_type)
+        if spec is None:
             return TestResult(
                 success=False,
-                message="API测试失败",
-                error=str(e)
+                message=f"暂不支持测试厂商类型: {provider_type}",
+                error="不支持的厂商类型"
             )
 
-    @staticmethod
-    async def _test_zhipu(
-        api_key: str,
-        model_name: str,
-        api_endpoint: Optional[str] = None
-    ) -> TestResult:
-        """测试智谱AI API连接"""
-        endpoint = api_endpoint or "https://open.bigmodel.cn/api/paas/v4/chat/completions"
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
+        endpoint = api_endpoint or spec.endpoint
+        headers = {"Content-Type": "application/json", **spec.auth(api_key)}
         payload = {
             "model": model_name,
-            "messages": [
-                {"role": "user", "content": "你好"}
-            ],
+            "messages": [{"role": "user", "content": spec.prompt}],
             "max_tokens": 10
         }
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(endpoint, headers=headers, json=payload)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    if "choices" in data and len(data["choices"]) > 0:
-                        return TestResult(
-                            success=True,
-                            message=f"智谱AI API连接成功！模型响应: {data['choices'][0]['message']['content'][:20]}..."
-                        )
-                    else:
-                        return TestResult(
-                            success=False,
-                            message="API返回格式异常",
-                            error="响应中缺少choices字段"
-                        )
-                elif response.status_code == 401:
-                    return TestResult(
-                        success=False,
-                        message="API Key验证失败",
-                        error="请检查API Key是否正确"
-                    )
-                else:
-                    return TestResult(
-                        success=False,
-                        message=f"API请求失败，状态码: {response.status_code}",
-                        error=response.text
-                    )
+            response = await get_llm_http_client().post(
+                endpoint, headers=headers, json=payload, timeout=API_TEST_TIMEOUT
+            )
         except httpx.TimeoutException:
             return TestResult(
                 success=False,
                 message="请求超时",
-                error="连接智谱AI API超时，请检查网络"
+                error=f"连接{spec.label}超时，请检查网络"
             )
         except Exception as e:
+            return TestResult(success=False, message="连接失败", error=str(e))
+
+        if response.status_code == 401:
+            return TestResult(success=False, message="API Key验证失败", error=spec.unauthorized_hint)
+        if response.status_code != 200:
             return TestResult(
                 success=False,
-                message="连接失败",
-                error=str(e)
+                message=f"API请求失败: {response.status_code}",
+                error=response.text[:100]
             )
 
-    @staticmethod
-    async def _test_openai(
-        api_key: str,
-        model_name: str,
-        api_endpoint: Optional[str] = None
-    ) -> TestResult:
-        """测试OpenAI API连接"""
-        endpoint = api_endpoint or "https://api.openai.com/v1/chat/completions"
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": model_name,
-            "messages": [{"role": "user", "content": "Hello"}],
-            "max_tokens": 10
-        }
-
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(endpoint, headers=headers, json=payload)
-
-                if response.status_code == 200:
-                    return TestResult(success=True, message="OpenAI API连接成功！")
-                elif response.status_code == 401:
-                    return TestResult(success=False, message="API Key验证失败", error="请检查API Key")
-                else:
-                    return TestResult(
-                        success=False,
-                        message=f"API请求失败: {response.status_code}",
-                        error=response.text[:100]
-                    )
-        except Exception as e:
-            return TestResult(success=False, message="连接失败", error=str(e))
-
-    @staticmethod
-    async def _test_anthropic(
-        api_key: str,
-        model_name: str,
-        api_endpoint: Optional[str] = None
-    ) -> TestResult:
-        """测试Anthropic API连接"""
-        endpoint = api_endpoint or "https://api.anthropic.com/v1/messages"
-
-        headers = {
-            "x-api-key": api_key,
-            "Content-Type": "application/json",
-            "anthropic-version": "2023-06-01"
-        }
-
-        payload = {
-            "model": model_name,
-            "max_tokens": 10,
-            "messages": [{"role": "user", "content": "Hello"}]
-        }
-
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(endpoint, headers=headers, json=payload)
-
-                if response.status_code == 200:
-                    return TestResult(success=True, message="Anthropic API连接成功！")
-                elif response.status_code == 401:
-                    return TestResult(success=False, message="API Key验证失败", error="请检查API Key")
-                else:
-                    return TestResult(
-                        success=False,
-                        message=f"API请求失败: {response.status_code}",
-                        error=response.text[:100]
-                    )
-        except Exception as e:
-            return TestResult(success=False, message="连接失败", error=str(e))
-
-    @staticmethod
-    async def _test_qwen(
-        api_key: str,
-        model_name: str,
-        api_endpoint: Optional[str] = None
-    ) -> TestResult:
-        """测试通义千问API连接"""
-        endpoint = api_endpoint or "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": model_name,
-            "messages": [{"role": "user", "content": "你好"}],
-            "max_tokens": 10
-        }
-
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(endpoint, headers=headers, json=payload)
-
-                if response.status_code == 200:
-                    return TestResult(success=True, message="通义千问API连接成功！")
-                elif response.status_code == 401:
-                    return TestResult(success=False, message="API Key验证失败", error="请检查API Key")
-                else:
-                    return TestResult(
-                        success=False,
-                        message=f"API请求失败: {response.status_code}",
-                        error=response.text[:100]
-                    )
-        except Exception as e:
-            return TestResult(success=False, message="连接失败", error=str(e))
-
-    @staticmethod
-    async def _test_qianfan(
-        api_key: str,
-        model_name: str,
-        api_endpoint: Optional[str] = None
-    ) -> TestResult:
-        """测试文心一言API连接"""
-        endpoint = api_endpoint or "https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/completions"
-
-        headers = {
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": model_name,
-            "messages": [{"role": "user", "content": "你好"}],
-            "max_tokens": 10
-        }
-
-        # 文心一言需要从API Key中提取 Access Key 和 Secret Key
+        if not spec.check_choices:
+            return TestResult(success=True, message=f"{spec.label}连接成功！")
         try:
-            # 简化测试：只检查端点是否可达
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(endpoint, headers=headers, json=payload)
-
-                if response.status_code == 200:
-                    return TestResult(success=True, message="文心一言API连接成功！")
-                elif response.status_code == 401:
-                    return TestResult(success=False, message="API Key验证失败", error="请检查API Key格式")
-                else:
-                    return TestResult(
-                        success=False,
-                        message=f"API请求失败: {response.status_code}",
-                        error=response.text[:100]
-                    )
-        except Exception as e:
-            return TestResult(success=False, message="连接失败", error=str(e))
+            reply = response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return TestResult(
+                success=False,
+                message="API返回格式异常",
+                error="响应中缺少choices字段"
+            )
+        return TestResult(success=True, message=f"{spec.label}连接成功！模型响应: {reply[:20]}...")
@@ -3,31 +3,59 @@ Sisyphus-api-engine 执行适配器
 负责调用 sisyphus-api-engine 命令并处理输出
 """
 
+import asyncio
 import os
-import json
+import shutil
 import subprocess
 import tempfile
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 
+import orjson
+import yaml
+
+try:
+    # 优先使用 libyaml 的 C 实现，解析速度远快于纯 Python 版本
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader as YamlSafeLoader
+
+
+# 单次执行引擎命令的超时（秒）
+ENGINE_TIMEOUT = 300
+
+
+@lru_cache(maxsize=None)
+def _engine_installed(engine_cmd: str) -> bool:
+    """引擎命令是否在 PATH 中（运行期间安装状态不变，按命令名缓存结果）"""
+    return shutil.which(engine_cmd) is not None
+
 
 class APIEngineAdapter:
-    """Sisyphus-api-engine 执行适配器"""
+    """
+    Sisyphus-api-engine 执行适配器
 
-    def __init__(self, temp_dir: Optional[str] = None):
+    实例不保存请求级状态（每次执行使用独立的临时文件），可作为单例在并发请求间共享。
+    """
+
+    def __init__(self, temp_dir: Optional[str] = None, stdin_cases: bool = False):
         """
         初始化适配器
 
         Args:
             temp_dir: 临时文件目录，默认为系统临时目录
+            stdin_cases: JSON 输出时通过标准输入传递用例（--cases -），不写临时文件；
+                需要引擎支持从标准输入读取用例，由配置项 API_ENGINE_STDIN_CASES 开启
         """
         self.temp_dir = temp_dir or tempfile.gettempdir()
         self.engine_cmd = "sisyphus-api-engine"
+        self.stdin_cases = stdin_cases
 
         # 确保临时目录存在
         os.makedirs(self.temp_dir, exist_ok=True)
 
-    def execute_test_case(
+    async def execute_test_case(
         self,
         yaml_content: str,
         environment: Optional[str] = None,
@@ -37,6 +65,8 @@ class APIEngineAdapter:
         """
         执行测试用例
 
+        通过异步子进程运行引擎，等待期间不阻塞事件循环，多个执行可并发进行
+
         Args:
             yaml_content: YAML 测试用例内容
             environment: 环境名称（如 dev, prod）
@@ -62,19 +92,29 @@ class APIEngineAdapter:
         temp_output_file = None
 
         try:
-            # 创建临时 YAML 文件
-            temp_yaml_file = self._create_temp_file(yaml_content, suffix=".yaml")
+            # JSON 结果从标准输出读取，启用 stdin_cases 时用例也经标准输入传入，无需落盘；
+            # 其他格式的报告文件路径由 YAML 文件路径推导，仍需临时文件
+            stdin_input = None
+            if self.stdin_cases and output_format == "json":
+                cases_arg = "-"
+                stdin_input = yaml_content.encode("utf-8")
+            else:
+                # 创建临时 YAML 文件（磁盘写入放到线程中执行）
+                temp_yaml_file = await asyncio.to_thread(
+                    self._create_temp_file, yaml_content, ".yaml"
+                )
+                cases_arg = temp_yaml_file
 
             # 构建命令
             cmd = self._build_command(
-                temp_yaml_file,
+                cases_arg,
                 environment=environment,
                 verbose=verbose,
                 output_format=output_format
             )
 
             # 执行命令
-            result = self._run_command(cmd)
+            result = await self._run_command(cmd, stdin_input)
 
             # 解析输出
             if output_format == "json":
@@ -83,7 +123,9 @@ class APIEngineAdapter:
             else:
                 # 其他格式：从输出文件读取
                 temp_output_file = self._get_output_file_path(temp_yaml_file, output_format)
-                output_data = self._read_output_file(temp_output_file, output_format)
+                output_data = await asyncio.to_thread(
+                    self._read_output_file, temp_output_file, output_format
+                )
 
             return output_data
 
@@ -105,19 +147,12 @@ class APIEngineAdapter:
         """
         检查 sisyphus-api-engine 是否已安装
 
+        使用 shutil.which 在进程内查找，不再派生 which 子进程；结果在进程内缓存
+
         Returns:
             True 如果已安装，False 否则
         """
-        try:
-            result = subprocess.run(
-                ["which", self.engine_cmd],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        return _engine_installed(self.engine_cmd)
 
     def _create_temp_file(self, content: str, suffix: str = ".yaml") -> str:
         """
@@ -174,48 +209,65 @@ class APIEngineAdapter:
 
         return cmd
 
-    def _run_command(self, cmd: list) -> subprocess.CompletedProcess:
+    async def _run_command(
+        self,
+        cmd: list,
+        stdin_input: Optional[bytes] = None
+    ) -> subprocess.CompletedProcess:
         """
-        运行命令
+        运行命令（异步子进程）
 
         Args:
             cmd: 命令列表
+            stdin_input: 写入子进程标准输入的内容（可选）
 
         Returns:
-            命令执行结果
+            命令执行结果（stdout/stderr 已解码为文本）
 
         Raises:
-            RuntimeError: 命令执行失败
+            RuntimeError: 命令执行失败或超时
         """
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5分钟超时
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if stdin_input is not None else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
                 cwd=self.temp_dir
             )
-
-            # 检查返回码
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout
-                raise RuntimeError(
-                    f"执行失败 (返回码: {result.returncode})\n"
-                    f"命令: {' '.join(cmd)}\n"
-                    f"错误: {error_msg}"
-                )
-
-            return result
-
-        except subprocess.TimeoutExpired:
-            raise RuntimeError(f"执行超时 (300秒): {' '.join(cmd)}")
-
         except FileNotFoundError:
             raise FileNotFoundError(
                 f"命令未找到: {cmd[0]}。"
                 f"请确保 sisyphus-api-engine 已安装并添加到 PATH"
             )
 
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(stdin_input), timeout=ENGINE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise RuntimeError(f"执行超时 ({ENGINE_TIMEOUT}秒): {' '.join(cmd)}")
+
+        result = subprocess.CompletedProcess(
+            cmd,
+            proc.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace")
+        )
+
+        # 检查返回码
+        if result.returncode != 0:
+            error_msg = result.stderr or result.stdout
+            raise RuntimeError(
+                f"执行失败 (返回码: {result.returncode})\n"
+                f"命令: {' '.join(cmd)}\n"
+                f"错误: {error_msg}"
+            )
+
+        return result
+
     def _parse_json_output(self, output: str) -> Dict[str, Any]:
         """
         解析 JSON 格式输出
@@ -230,8 +282,8 @@ class APIEngineAdapter:
             ValueError: JSON 解析失败
         """
         try:
-            return json.loads(output)
-        except json.JSONDecodeError as e:
+            return orjson.loads(output)
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"JSON 解析失败: {e}\n输出内容: {output}")
 
     def _get_output_file_path(self, yaml_file: str, output_format: str) -> str:
@@ -270,14 +322,15 @@ class APIEngineAdapter:
             raise FileNotFoundError(f"输出文件不存在: {output_file}")
 
         try:
-            with open(output_file, 'r', encoding='utf-8') as f:
+            # 以二进制读取：orjson 直接解析 bytes，省去解码步骤
+            with open(output_file, 'rb') as f:
                 content = f.read()
 
             if output_format == "json":
-                return json.loads(content)
+                return orjson.loads(content)
             else:
                 # 对于非 JSON 格式，返回原始内容
-                return {"raw_output": content}
+                return {"raw_output": content.decode('utf-8')}
 
         except Exception as e:
             raise RuntimeError(f"读取输出文件失败: {e}")
@@ -321,6 +374,35 @@ class APIEngineAdapter:
                 except Exception:
                     pass
 
+    def parse_and_validate_yaml(
+        self,
+        yaml_content: str
+    ) -> Tuple[bool, Optional[Dict[str, Any]], List[str]]:
+        """
+        解析并验证 YAML，成功时返回解析结果，避免调用方再次解析同一文档
+
+        先在进程内做语法解析（语法错误时无需启动验证命令），
+        再交给 sisyphus-api-validate 校验是否符合引擎规范。
+
+        Args:
+            yaml_content: YAML 内容
+
+        Returns:
+            (是否有效, 解析后的字典, 错误信息列表)
+        """
+        try:
+            data = yaml.load(yaml_content, Loader=YamlSafeLoader)
+        except yaml.YAMLError as e:
+            return False, None, [f"YAML 语法错误: {e}"]
+
+        if not isinstance(data, dict):
+            return False, None, ["YAML 顶层必须是对象"]
+
+        if not self.validate_yaml(yaml_content):
+            return False, data, ["YAML 不符合 API Engine 规范"]
+
+        return True, data, []
+
     def get_engine_version(self) -> Optional[str]:
         """
         获取 sisyphus-api-engine 版本
@@ -346,10 +428,11 @@ class APIEngineAdapter:
 
 
 # 便捷函数
-def execute_test_case(
+async def execute_test_case(
     yaml_content: str,
     environment: Optional[str] = None,
-    verbose: bool = True
+    verbose: bool = True,
+    stdin_cases: bool = False
 ) -> Dict[str, Any]:
     """
     执行测试用例（便捷函数）
@@ -358,9 +441,10 @@ def execute_test_case(
         yaml_content: YAML 测试用例内容
         environment: 环境名称
         verbose: 是否详细输出
+        stdin_cases: 是否通过标准输入传递用例（应用内传入 settings.API_ENGINE_STDIN_CASES）
 
     Returns:
         执行结果字典
     """
-    adapter = APIEngineAdapter()
-    return adapter.execute_test_case(yaml_content, environment, verbose)
+    adapter = APIEngineAdapter(stdin_cases=stdin_cases)
+    return await adapter.execute_test_case(yaml_content, environment, verbose)
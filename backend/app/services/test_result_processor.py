@@ -10,7 +10,11 @@ from app.models.api_test_case import ApiTestExecution, ApiTestStepResult
 
 
 class TestResultProcessor:
-    """测试结果处理器"""
+    """
+    测试结果处理器
+
+    实例不保存请求级状态（会话由调用方传入），可作为单例在并发请求间共享。
+    """
 
     def __init__(self):
         """初始化处理器"""
@@ -8,7 +8,11 @@ from datetime import datetime
 
 
 class YAMLGenerator:
-    """YAML 生成器 - 将前端传来的结构化配置转换为 YAML 格式"""
+    """
+    YAML 生成器 - 将前端传来的结构化配置转换为 YAML 格式
+
+    实例不保存请求级状态，可作为单例在并发请求间共享。
+    """
 
     def __init__(self):
         """初始化 YAML 生成器"""
@@ -3,10 +3,19 @@ API Engine 适配器单元测试
 使用 mock 模拟命令执行
 """
 
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import json
-from app.services.api_engine_adapter import APIEngineAdapter, execute_test_case
+from app.services.api_engine_adapter import APIEngineAdapter, _engine_installed, execute_test_case
+
+
+def _mock_process(returncode, stdout=b"", stderr=b""):
+    """模拟 asyncio 子进程"""
+    process = MagicMock(returncode=returncode)
+    process.communicate = AsyncMock(return_value=(stdout, stderr))
+    process.wait = AsyncMock(return_value=returncode)
+    return process
 
 
 class TestAPIEngineAdapter:
@@ -18,22 +27,30 @@ class TestAPIEngineAdapter:
 
     def test_check_engine_installed(self):
         """测试检查引擎是否已安装"""
-        with patch('subprocess.run') as mock_run:
+        with patch('shutil.which') as mock_which:
             # 引擎已安装
-            mock_run.return_value = MagicMock(returncode=0)
+            _engine_installed.cache_clear()
+            mock_which.return_value = "/usr/local/bin/sisyphus-api-engine"
+            assert self.adapter._check_engine_installed() is True
+
+            # 结果被缓存，不再查找 PATH
             assert self.adapter._check_engine_installed() is True
+            assert mock_which.call_count == 1
 
             # 引擎未安装
-            mock_run.return_value = MagicMock(returncode=1)
+            _engine_installed.cache_clear()
+            mock_which.return_value = None
             assert self.adapter._check_engine_installed() is False
 
-    @patch('subprocess.run')
-    def test_execute_test_case_success(self, mock_run):
+        _engine_installed.cache_clear()
+
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_success(self, mock_exec):
         """测试成功执行测试用例"""
         # 模拟命令执行成功
-        mock_run.return_value = MagicMock(
+        mock_exec.return_value = _mock_process(
             returncode=0,
-            stdout='{"test_case": {"name": "测试", "status": "passed"}}'
+            stdout='{"test_case": {"name": "测试", "status": "passed"}}'.encode()
         )
 
         # 模拟 which 命令
@@ -47,73 +64,101 @@ steps:
     url: "https://httpbin.org/get"
 """
 
-            result = self.adapter.execute_test_case(yaml_content)
+            result = asyncio.run(self.adapter.execute_test_case(yaml_content))
 
             # 验证返回结果
             assert result["test_case"]["name"] == "测试"
             assert result["test_case"]["status"] == "passed"
 
-    @patch('subprocess.run')
-    def test_execute_test_case_with_environment(self, mock_run):
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_with_environment(self, mock_exec):
         """测试使用环境参数执行测试用例"""
-        mock_run.return_value = MagicMock(
+        mock_exec.return_value = _mock_process(
             returncode=0,
-            stdout='{"test_case": {"status": "passed"}}'
+            stdout=b'{"test_case": {"status": "passed"}}'
         )
 
         with patch.object(self.adapter, '_check_engine_installed', return_value=True):
             yaml_content = "name: 测试\nsteps: []"
 
-            result = self.adapter.execute_test_case(
+            result = asyncio.run(self.adapter.execute_test_case(
                 yaml_content,
                 environment="prod"
-            )
+            ))
 
             # 验证命令包含 --profile prod
             assert result is not None
             # 检查调用参数
-            call_args = mock_run.call_args
-            cmd = call_args[0][0]
+            cmd = mock_exec.call_args[0]
             assert "--profile" in cmd
             assert "prod" in cmd
 
-    @patch('subprocess.run')
-    def test_execute_test_case_engine_not_found(self, mock_run):
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_engine_not_found(self, mock_exec):
         """测试引擎未安装的情况"""
         # 模拟 which 命令返回未找到
         with patch.object(self.adapter, '_check_engine_installed', return_value=False):
             yaml_content = "name: 测试\nsteps: []"
 
             with pytest.raises(FileNotFoundError, match="sisyphus-api-engine 未安装"):
-                self.adapter.execute_test_case(yaml_content)
+                asyncio.run(self.adapter.execute_test_case(yaml_content))
 
-    @patch('subprocess.run')
-    def test_execute_test_case_command_failed(self, mock_run):
+        mock_exec.assert_not_called()
+
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_command_failed(self, mock_exec):
         """测试命令执行失败"""
         # 模拟命令执行失败
-        mock_run.return_value = MagicMock(
+        mock_exec.return_value = _mock_process(
             returncode=1,
-            stderr="YAML 语法错误"
+            stderr="YAML 语法错误".encode()
         )
 
         with patch.object(self.adapter, '_check_engine_installed', return_value=True):
             yaml_content = "invalid: yaml: content: ["
 
             with pytest.raises(RuntimeError, match="执行失败"):
-                self.adapter.execute_test_case(yaml_content)
+                asyncio.run(self.adapter.execute_test_case(yaml_content))
 
-    @patch('subprocess.run')
-    def test_execute_test_case_timeout(self, mock_run):
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_timeout(self, mock_exec):
         """测试执行超时"""
-        # 模拟超时异常
-        from subprocess import TimeoutExpired
-        mock_run.side_effect = TimeoutExpired("cmd", 300)
+        # 模拟进程一直不结束
+        async def hang(stdin_input=None):
+            await asyncio.sleep(1)
 
-        with patch.object(self.adapter, '_check_engine_installed', return_value=True):
+        process = _mock_process(returncode=None)
+        process.communicate.side_effect = hang
+        mock_exec.return_value = process
+
+        with patch.object(self.adapter, '_check_engine_installed', return_value=True), \
+                patch('app.services.api_engine_adapter.ENGINE_TIMEOUT', 0.01):
             yaml_content = "name: 测试\nsteps: []"
 
             with pytest.raises(RuntimeError, match="执行超时"):
-                self.adapter.execute_test_case(yaml_content)
+                asyncio.run(self.adapter.execute_test_case(yaml_content))
+
+        # 超时后终止子进程
+        process.kill.assert_called_once()
+
+    @patch('asyncio.create_subprocess_exec', new_callable=AsyncMock)
+    def test_execute_test_case_stdin_cases(self, mock_exec):
+        """测试通过标准输入传递用例"""
+        process = _mock_process(returncode=0, stdout=b'{"test_case": {"status": "passed"}}')
+        mock_exec.return_value = process
+        adapter = APIEngineAdapter(stdin_cases=True)
+        yaml_content = "name: 测试\nsteps: []"
+
+        with patch.object(adapter, '_check_engine_installed', return_value=True), \
+                patch.object(adapter, '_create_temp_file') as mock_create:
+            result = asyncio.run(adapter.execute_test_case(yaml_content))
+
+        assert result["test_case"]["status"] == "passed"
+        # 不创建临时文件，用例内容写入标准输入
+        mock_create.assert_not_called()
+        cmd = mock_exec.call_args[0]
+        assert cmd[cmd.index("--cases") + 1] == "-"
+        process.communicate.assert_awaited_once_with(yaml_content.encode("utf-8"))
 
     def test_create_temp_file(self):
         """测试创建临时文件"""
@@ -214,6 +259,29 @@ steps:
 
         assert result is False
 
+    @patch('subprocess.run')
+    def test_parse_and_validate_yaml_success(self, mock_run):
+        """测试解析并验证 YAML 成功时返回解析结果"""
+        mock_run.return_value = MagicMock(returncode=0)
+
+        yaml_content = "name: 测试\nsteps: []"
+        is_valid, data, errors = self.adapter.parse_and_validate_yaml(yaml_content)
+
+        assert is_valid is True
+        assert data == {"name": "测试", "steps": []}
+        assert errors == []
+
+    @patch('subprocess.run')
+    def test_parse_and_validate_yaml_syntax_error(self, mock_run):
+        """测试 YAML 语法错误时不调用验证命令"""
+        yaml_content = "invalid: yaml: ["
+        is_valid, data, errors = self.adapter.parse_and_validate_yaml(yaml_content)
+
+        assert is_valid is False
+        assert data is None
+        assert len(errors) == 1
+        mock_run.assert_not_called()
+
     @patch('subprocess.run')
     def test_get_engine_version(self, mock_run):
         """测试获取引擎版本"""
@@ -237,11 +305,11 @@ steps:
 
     def test_convenience_function(self):
         """测试便捷函数"""
-        with patch.object(APIEngineAdapter, 'execute_test_case') as mock_execute:
+        with patch.object(APIEngineAdapter, 'execute_test_case', new_callable=AsyncMock) as mock_execute:
             mock_execute.return_value = {"test_case": {"status": "passed"}}
 
             yaml_content = "name: 测试\nsteps: []"
-            result = execute_test_case(yaml_content)
+            result = asyncio.run(execute_test_case(yaml_content))
 
             assert result["test_case"]["status"] == "passed"
             mock_execute.assert_called_once()
@@ -281,7 +349,7 @@ steps:
             pytest.skip("sisyphus-api-engine 未安装")
 
         # 执行测试
-        result = adapter.execute_test_case(yaml_content)
+        result = asyncio.run(adapter.execute_test_case(yaml_content))
 
         # 验证结果
         assert "test_case" in result
@@ -188,7 +188,7 @@ export const apiTestCasesApi = {
 
 // AI 配置管理 API
 export const aiConfigApi = {
-    list: () => api.get('/ai/configs/'),
+    list: (params?: { include_masked?: boolean }) => api.get('/ai/configs/', { params }),
     getDefault: () => api.get('/ai/configs/default'),
     get: (id: number) => api.get(`/ai/configs/${id}`),
     create: (data: { provider_name: string; provider_type: string; api_key: string; model_name: string; temperature?: number; is_default?: boolean }) =>
@@ -229,8 +229,9 @@ export const testPointsApi = {
 export const functionalTestCasesApi = {
     generate: (data: { requirement_id: number; test_point_ids: number[]; module_name: string; page_name: string; case_type: string; include_knowledge?: boolean }) =>
         api.post('/test-cases/generate/generate', data),
-    listByRequirement: (requirementId: number) =>
-        api.get(`/test-cases/generate/requirement/${requirementId}`),
+    // 不传参数时返回全部；传入 limit/after 时分页，响应头 X-Next-Cursor 为下一页的 after 参数
+    listByRequirement: (requirementId: number, params?: { limit?: number; after?: string }) =>
+        api.get(`/test-cases/generate/requirement/${requirementId}`, { params }),
     get: (caseId: string) => api.get(`/test-cases/generate/${caseId}`),
     delete: (caseId: string) => api.delete(`/test-cases/generate/${caseId}`),
     approve: (caseId: string) => api.put(`/test-cases/generate/${caseId}/approve`),
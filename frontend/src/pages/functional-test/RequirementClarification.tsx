@@ -111,15 +111,19 @@ export default function RequirementClarification() {
 
             try {
               const parsed = JSON.parse(data)
+              // 服务端会把短时间内到达的多个事件合并为一个 batch 帧
+              const events = parsed.type === 'batch' ? parsed.items : [parsed]
 
-              if (parsed.type === 'content') {
-                assistantMessage += parsed.content
-                setCurrentResponse(assistantMessage)
-              } else if (parsed.type === 'state') {
-                setConversationState(parsed.state)
-              } else if (parsed.type === 'error') {
-                toast.error(parsed.error || '生成失败')
-                setIsStreaming(false)
+              for (const event of events) {
+                if (event.type === 'content') {
+                  assistantMessage += event.content
+                  setCurrentResponse(assistantMessage)
+                } else if (event.type === 'state') {
+                  setConversationState(event.state)
+                } else if (event.type === 'error') {
+                  toast.error(event.error || '生成失败')
+                  setIsStreaming(false)
+                }
               }
             } catch (e) {
               console.error('Failed to parse SSE data:', data)